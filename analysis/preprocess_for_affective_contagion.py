@@ -8,6 +8,10 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 from scipy.stats import chi2_contingency
 import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'preprocess'))
+from exposure_io import load_exposure, flatten
 
 
 def clean_data(us_path, jp_path):
@@ -16,16 +20,16 @@ def clean_data(us_path, jp_path):
   or save_dataframe_for_within_culture_comparison
 
   Input:
-    us_path: file path to US .pkl file to analyze (string)
-    jp_path: file path to JP .pkl file to analyze (string)
+    us_path: file path to US .pkl file or columnar directory to analyze (string)
+    jp_path: file path to JP .pkl file or columnar directory to analyze (string)
   Output:
     dfUS: cleaned dataframe for US data
     dfJP: cleaned dataframe for JP data
   '''
 
   # Read in data
-  data_us = pd.read_pickle(us_path)
-  data_jp = pd.read_pickle(jp_path)
+  data_us = load_exposure(us_path)
+  data_jp = load_exposure(jp_path)
 
 
   ############################### Processing ##################################################
@@ -36,24 +40,24 @@ def clean_data(us_path, jp_path):
 
 
   # Flatten data
-  usnumFriendsFlat = sum(data_us['numFriends'],[])
-  usUsableFriendsFlat = sum(data_us['usableFriends'],[])
-  usYDatesFlat = sum(data_us['dates'],[])
-  usYHAPFlat = sum(data_us['HAP'],[])
-  usYLAPFlat = sum(data_us['LAP'],[])
-  usYHANFlat = sum(data_us['HAN'],[])
-  usYLANFlat = sum(data_us['LAN'],[])
-  usYNEUFlat = sum(data_us['NEU'],[])
-  usFriendHAPPropFlat = sum(data_us['friendHAP'],[])
-  usFriendLAPPropFlat = sum(data_us['friendLAP'],[])
-  usFriendHANPropFlat = sum(data_us['friendHAN'],[])
-  usFriendLANPropFlat = sum(data_us['friendLAN'],[])
-  usFriendNEUPropFlat = sum(data_us['friendNEU'],[])
-  usFriendHAPCountsFlat = sum(data_us['friendHAPCounts'],[])
-  usFriendLAPCountsFlat = sum(data_us['friendLAPCounts'],[])
-  usFriendHANCountsFlat = sum(data_us['friendHANCounts'],[])
-  usFriendLANCountsFlat = sum(data_us['friendLANCounts'],[])
-  usFriendNEUCountsFlat = sum(data_us['friendNEUCounts'],[])       
+  usnumFriendsFlat = flatten(data_us, 'numFriends')
+  usUsableFriendsFlat = flatten(data_us, 'usableFriends')
+  usYDatesFlat = flatten(data_us, 'dates')
+  usYHAPFlat = flatten(data_us, 'HAP')
+  usYLAPFlat = flatten(data_us, 'LAP')
+  usYHANFlat = flatten(data_us, 'HAN')
+  usYLANFlat = flatten(data_us, 'LAN')
+  usYNEUFlat = flatten(data_us, 'NEU')
+  usFriendHAPPropFlat = flatten(data_us, 'friendHAP')
+  usFriendLAPPropFlat = flatten(data_us, 'friendLAP')
+  usFriendHANPropFlat = flatten(data_us, 'friendHAN')
+  usFriendLANPropFlat = flatten(data_us, 'friendLAN')
+  usFriendNEUPropFlat = flatten(data_us, 'friendNEU')
+  usFriendHAPCountsFlat = flatten(data_us, 'friendHAPCounts')
+  usFriendLAPCountsFlat = flatten(data_us, 'friendLAPCounts')
+  usFriendHANCountsFlat = flatten(data_us, 'friendHANCounts')
+  usFriendLANCountsFlat = flatten(data_us, 'friendLANCounts')
+  usFriendNEUCountsFlat = flatten(data_us, 'friendNEUCounts')       
   usFriendHAPPropFlatPerc = np.array(usFriendHAPPropFlat)*100
   usFriendLAPPropFlatPerc = np.array(usFriendLAPPropFlat)*100
   usFriendHANPropFlatPerc = np.array(usFriendHANPropFlat)*100
@@ -61,24 +65,24 @@ def clean_data(us_path, jp_path):
   usFriendNEUPropFlatPerc = np.array(usFriendNEUPropFlat)*100
 
 
-  jpnumFriendsFlat = sum(data_jp['numFriends'],[])
-  jpUsableFriendsFlat = sum(data_jp['usableFriends'],[])
-  jpYDatesFlat = sum(data_jp['dates'],[])
-  jpYHAPFlat = sum(data_jp['HAP'],[])
-  jpYLAPFlat = sum(data_jp['LAP'],[])
-  jpYHANFlat = sum(data_jp['HAN'],[])
-  jpYLANFlat = sum(data_jp['LAN'],[])
-  jpYNEUFlat = sum(data_jp['NEU'],[])
-  jpFriendHAPPropFlat = sum(data_jp['friendHAP'],[])
-  jpFriendLAPPropFlat = sum(data_jp['friendLAP'],[])
-  jpFriendHANPropFlat = sum(data_jp['friendHAN'],[])
-  jpFriendLANPropFlat = sum(data_jp['friendLAN'],[])
-  jpFriendNEUPropFlat = sum(data_jp['friendNEU'],[])
-  jpFriendHAPCountsFlat = sum(data_jp['friendHAPCounts'],[])
-  jpFriendLAPCountsFlat = sum(data_jp['friendLAPCounts'],[])
-  jpFriendHANCountsFlat = sum(data_jp['friendHANCounts'],[])
-  jpFriendLANCountsFlat = sum(data_jp['friendLANCounts'],[])
-  jpFriendNEUCountsFlat = sum(data_jp['friendNEUCounts'],[])
+  jpnumFriendsFlat = flatten(data_jp, 'numFriends')
+  jpUsableFriendsFlat = flatten(data_jp, 'usableFriends')
+  jpYDatesFlat = flatten(data_jp, 'dates')
+  jpYHAPFlat = flatten(data_jp, 'HAP')
+  jpYLAPFlat = flatten(data_jp, 'LAP')
+  jpYHANFlat = flatten(data_jp, 'HAN')
+  jpYLANFlat = flatten(data_jp, 'LAN')
+  jpYNEUFlat = flatten(data_jp, 'NEU')
+  jpFriendHAPPropFlat = flatten(data_jp, 'friendHAP')
+  jpFriendLAPPropFlat = flatten(data_jp, 'friendLAP')
+  jpFriendHANPropFlat = flatten(data_jp, 'friendHAN')
+  jpFriendLANPropFlat = flatten(data_jp, 'friendLAN')
+  jpFriendNEUPropFlat = flatten(data_jp, 'friendNEU')
+  jpFriendHAPCountsFlat = flatten(data_jp, 'friendHAPCounts')
+  jpFriendLAPCountsFlat = flatten(data_jp, 'friendLAPCounts')
+  jpFriendHANCountsFlat = flatten(data_jp, 'friendHANCounts')
+  jpFriendLANCountsFlat = flatten(data_jp, 'friendLANCounts')
+  jpFriendNEUCountsFlat = flatten(data_jp, 'friendNEUCounts')
   jpFriendHAPPropFlatPerc = np.array(jpFriendHAPPropFlat)*100
   jpFriendLAPPropFlatPerc = np.array(jpFriendLAPPropFlat)*100
   jpFriendHANPropFlatPerc = np.array(jpFriendHANPropFlat)*100
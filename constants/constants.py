@@ -13,6 +13,7 @@ PROCESSED_DATA_DIR = DATA_DIR / "processed"
 # calculate_exposure constants
 TIMESAMPLES = 50
 TIMELAPSE = np.timedelta64(1, 'h')
+MIN_FRIEND_TWEETS = 20
 
 # collection times
 US_COLLECTION_TIMES = ["12.19.18.6pm", "12.13.18.7pm", "12.11.18.11pm",
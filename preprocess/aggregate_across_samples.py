@@ -1,71 +1,141 @@
 ## FOR CHANGE
 import numpy as np
-import pickle
 import pandas as pd
+import argparse
+import glob
 import csv
 import sys
+import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from constants import US_COLLECTION_TIMES, JP_COLLECTION_TIMES
+from compressed_io import strip_compression
+from exposure_io import DATA_KEYS, ExposureWriter, is_columnar, load_exposure, save_exposure, save_provenance
 
-def aggregate_across_samples(pkl_files, output_path):
+
+COLLECTION_TIMES = {'US': US_COLLECTION_TIMES, 'JP': JP_COLLECTION_TIMES}
+
+
+def sample_name(path):
+    '''
+    File name of an input without extension, e.g. data/USA_12.19.18.6pm.pkl.gz -> USA_12.19.18.6pm.
+    '''
+    return os.path.splitext(os.path.basename(os.path.normpath(strip_compression(path))))[0]
+
+
+def expand_inputs(paths):
+    '''
+    Expand glob patterns in a list of input paths into (sample, path) pairs.
+    The sample name of a file is its file name without extension (and without .gz / .zst).
+
+    Input:
+        paths: list of .pkl files, columnar directories or glob patterns (expanded in sorted order)
+    Output:
+        samples: list of (sample, path)
+    '''
+    samples = []
+    for path in paths:
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        if not matches:
+            raise IOError("No input matches %s" % path)
+        for match in matches:
+            samples.append((sample_name(match), match))
+    return samples
+
+
+def collection_samples(pattern, country):
+    '''
+    Build (sample, path) pairs for every collection time of a country.
+
+    Input:
+        pattern: input path with a {time} placeholder, e.g. "data/processed/USA_stream_{time}.pkl"
+        country: "US" or "JP" (uses US_COLLECTION_TIMES or JP_COLLECTION_TIMES)
+    Output:
+        samples: list of (collection time, path)
+    '''
+    return [(t, pattern.format(time=t)) for t in COLLECTION_TIMES[country]]
+
+
+def read_manifest(manifest_path):
+    '''
+    Read (sample, path) pairs from a manifest csv with a "sample,path" header.
+    '''
+    manifest = pd.read_csv(manifest_path, dtype=str)
+    return list(zip(manifest['sample'], manifest['path']))
+
+
+def aggregate_across_samples(pkl_files, output_path, compression_level=None):
     '''
     Aggregate all .pkl files (saved output files from calculate_exposure) into one for analysis.
-    
+    Users of each sample are appended in input order. A columnar output is streamed to disk one
+    sample at a time, so the aggregate is never held in memory.
+    The source file and user offset of every sample are saved as the provenance table (see exposure_io.load_provenance).
+
     Input:
-        pkl_files: file path to a list of .pkl files that you want to aggregate, with no space to between each file (REQUIRED FORMAT: "[file1,file2,...]")
-        output_path: file path to which results are saved (REQUIRES .pkl) 
+        pkl_files: list of .pkl files (or columnar directories), or of (sample, path) pairs, that you want to aggregate
+        output_path: file path to which results are saved (.pkl, .pkl.gz or .pkl.zst, otherwise a columnar directory)
+        compression_level: compression level of a compressed pickle output (default: see compressed_io)
     Output:
         None
     '''
+    samples = [f if isinstance(f, tuple) else (sample_name(f), f) for f in pkl_files]
+
+    if is_columnar(output_path):
+        writer = ExposureWriter(output_path)
+        data_all = None
+    else:
+        writer = None
+        data_all = dict((k, []) for k in DATA_KEYS)
+
+    provenance = []
+    n_users = 0
+    n_values = 0
+    for sample, f in samples:
+        data_current = load_exposure(f)
+        sample_users = len(data_current['usableFriends'])
+        sample_values = sum(len(v) for v in data_current['usableFriends'])
 
-    data_all = {
-        "numFriends": [],
-        "usableFriends": [],
-        "dates": [],
-        "HAP": [],
-        "LAP": [],
-        "HAN": [],
-        "LAN": [],
-        "NEU": [],
-        "friendHAP": [],
-        "friendLAP": [],
-        "friendHAN": [],
-        "friendLAN": [],
-        "friendNEU": [],
-        "friendHAPCounts": [],
-        "friendLAPCounts": [],
-        "friendHANCounts": [],
-        "friendLANCounts": [],
-        "friendNEUCounts": []
-    }
-
-
-    for f in pkl_files:
-        data_current = pd.read_pickle(f)
-
-        data_all['numFriends'] = data_all['numFriends'] + data_current['numFriends']
-        data_all['usableFriends'] = data_all['usableFriends'] + data_current['usableFriends']
-        data_all['dates'] = data_all['dates'] + data_current['dates']
-        data_all['HAP'] = data_all['HAP'] + data_current['HAP']
-        data_all['LAP'] = data_all['LAP'] + data_current['LAP']
-        data_all['HAN'] = data_all['HAN'] + data_current['HAN']
-        data_all['LAN'] = data_all['LAN'] + data_current['LAN']
-        data_all['NEU'] = data_all['NEU'] + data_current['NEU']
-        data_all['friendHAP'] = data_all['friendHAP'] + data_current['friendHAP']
-        data_all['friendLAP'] = data_all['friendLAP'] + data_current['friendLAP']
-        data_all['friendHAN'] = data_all['friendHAN'] + data_current['friendHAN']
-        data_all['friendLAN'] = data_all['friendLAN'] + data_current['friendLAN']
-        data_all['friendNEU'] = data_all['friendNEU'] + data_current['friendNEU']
-        data_all['friendHAPCounts'] = data_all['friendHAPCounts'] + data_current['friendHAPCounts']
-        data_all['friendLAPCounts'] = data_all['friendLAPCounts'] + data_current['friendLAPCounts']
-        data_all['friendHANCounts'] = data_all['friendHANCounts'] + data_current['friendHANCounts']
-        data_all['friendLANCounts'] = data_all['friendLANCounts'] + data_current['friendLANCounts']
-        data_all['friendNEUCounts'] = data_all['friendNEUCounts'] + data_current['friendNEUCounts']
-
-
-    with open(output_path, 'w') as f:
-        pickle.dump(data_all, f)
+        if writer is not None:
+            writer.append_data(data_current)
+        else:
+            for k in DATA_KEYS:
+                data_all[k].extend(list(v) for v in data_current[k])
+
+        provenance.append({'sample': sample, 'source': str(f),
+                           'user_offset': n_users, 'n_users': sample_users,
+                           'value_offset': n_values, 'n_values': sample_values})
+        n_users += sample_users
+        n_values += sample_values
+        del data_current
+
+
+    if writer is not None:
+        writer.close()
+    else:
+        save_exposure(data_all, output_path, compression_level)
+    save_provenance(provenance, output_path)
 
 
 if __name__ == '__main__':
-    aggregate_across_samples(sys.argv[1].strip('[]').split(','), sys.argv[2])
+    parser = argparse.ArgumentParser(description="Aggregate calculate_exposure outputs across samples.")
+    parser.add_argument('inputs', nargs='?', default=None,
+                        help='list of inputs or glob patterns (FORMAT: "[file1,file2,...]")')
+    parser.add_argument('output_path')
+    parser.add_argument('--manifest', help='csv with "sample,path" columns')
+    parser.add_argument('--pattern', help='input path with a {time} placeholder for each collection time')
+    parser.add_argument('--country', choices=sorted(COLLECTION_TIMES), help='collection times to use with --pattern')
+    parser.add_argument('--compression-level', type=int, help='level of a .pkl.gz / .pkl.zst output')
+    args = parser.parse_args()
+    if args.pattern and not args.country:
+        parser.error('--pattern requires --country')
+    if not (args.inputs or args.manifest or args.pattern):
+        parser.error('give inputs, --manifest or --pattern')
+
+    if args.manifest:
+        samples = read_manifest(args.manifest)
+    elif args.pattern:
+        samples = collection_samples(args.pattern, args.country)
+    else:
+        samples = expand_inputs(args.inputs.strip('[]').split(','))
 
+    aggregate_across_samples(samples, args.output_path, args.compression_level)
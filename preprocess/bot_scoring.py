@@ -0,0 +1,200 @@
+import threading
+import sqlite3
+import random
+import queue
+import time
+
+
+# Botometer scores of accepted users are below this (the "user" display score, from 0 to 5)
+BOT_THRESHOLD = 1
+
+# days a bot score is reused before the user is scored again
+BOT_SCORE_TTL_DAYS = 90
+
+
+class BotScoreCache(object):
+    '''
+    Persistent SQLite cache of Botometer scores by user id, shared across rounds and waves of the collection,
+    so a user is not scored again until its score is older than ttl.
+    Connections are per thread, so the workers of a BotCheckPool can share the cache.
+
+    Input:
+        path: SQLite database file
+        ttl: seconds a score is reused (default 90 days)
+    '''
+
+    def __init__(self, path, ttl=BOT_SCORE_TTL_DAYS * 86400):
+        self.path = str(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS bot_scores (userid INTEGER PRIMARY KEY, score REAL, scored REAL)')
+        db.commit()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=60)
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def get(self, userid):
+        '''
+        Output:
+            bot score of the user, or None if it was never scored or its score expired
+        '''
+        row = self._db().execute('SELECT score, scored FROM bot_scores WHERE userid = ?', (int(userid),)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def put(self, userid, score):
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO bot_scores VALUES (?, ?, ?)', (int(userid), float(score), time.time()))
+        db.commit()
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class BotCheckPool(object):
+    '''
+    Bot checks off the streaming callback: candidates (statuses that passed the cheap filters) wait in a bounded
+    queue for a pool of worker threads, which take the user's score from the BotScoreCache or from check_account,
+    and call accept with the statuses of users scored below threshold. submit never blocks: when the queue is full
+    the candidate is dropped, as the stream must keep up. A candidate can be submitted with a tag (e.g. the
+    collection round), which is passed back to accept, so results of candidates from an earlier round can be dropped.
+
+    Input:
+        check_account: function of a user id returning a Botometer result (e.g. botometer.Botometer.check_account)
+        accept: function called with the status, score and tag of every user scored below threshold
+                (from a worker thread)
+        cache: BotScoreCache (default None)
+        workers: number of worker threads (default 4)
+        queue_size: number of candidates that can wait (default 100)
+        threshold: accepted users score below this (default 1)
+    '''
+
+    def __init__(self, check_account, accept, cache=None, workers=4, queue_size=100, threshold=BOT_THRESHOLD):
+        self.check_account = check_account
+        self.accept = accept
+        self.cache = cache
+        self.threshold = threshold
+        self._candidates = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.counts = {'submitted': 0, 'dropped': 0, 'duplicates': 0, 'cached': 0, 'checked': 0, 'accepted': 0,
+                       'errors': 0}
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, status, tag=None):
+        '''
+        Queue a candidate status without blocking.
+
+        Input:
+            status: candidate status
+            tag: passed to accept with the status (default None)
+
+        Output:
+            True if queued, False if dropped (queue full, or its user already waits)
+        '''
+        userid = status.user.id
+        with self._lock:
+            if userid in self._pending:
+                self.counts['duplicates'] += 1
+                return False
+            try:
+                self._candidates.put_nowait((status, tag))
+            except queue.Full:
+                self.counts['dropped'] += 1
+                return False
+            self._pending.add(userid)
+            self.counts['submitted'] += 1
+        return True
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _work(self):
+        while True:
+            item = self._candidates.get()
+            if item is None:
+                if self.cache is not None:
+                    # this thread's connection
+                    self.cache.close()
+                return
+            status, tag = item
+            userid = status.user.id
+            try:
+                score = self.cache.get(userid) if self.cache is not None else None
+                if score is not None:
+                    self._count('cached')
+                else:
+                    score = self.check_account(userid)['display_scores']['user']
+                    self._count('checked')
+                    if self.cache is not None:
+                        self.cache.put(userid, score)
+                if score < self.threshold:
+                    self._count('accepted')
+                    self.accept(status, score, tag)
+            except Exception as e:
+                self._count('errors')
+                print("Error checking user %s: %s" % (str(userid), str(e)))
+            finally:
+                with self._lock:
+                    self._pending.discard(userid)
+                self._candidates.task_done()
+
+    def join(self):
+        '''
+        Wait until every queued candidate is checked.
+        '''
+        self._candidates.join()
+
+    def close(self):
+        '''
+        Check the queued candidates and stop the worker threads.
+        '''
+        for _ in self._threads:
+            self._candidates.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.cache is not None:
+            self.cache.close()
+
+
+class StubBotometer(object):
+    '''
+    Stand-in for botometer.Botometer to exercise a BotCheckPool without API keys: check_account waits latency
+    seconds and returns a random "user" display score, the same for a user id every time.
+
+    Input:
+        latency: seconds per check (default 0.5)
+        bot_share: share of users scored as bots (at least BOT_THRESHOLD) (default 0.3)
+        seed: seed of the scores (default 0)
+    '''
+
+    def __init__(self, latency=0.5, bot_share=0.3, seed=0):
+        self.latency = latency
+        self.bot_share = bot_share
+        self.seed = seed
+        self.calls = 0
+
+    def check_account(self, user_id):
+        self.calls += 1
+        time.sleep(self.latency)
+        rng = random.Random('%s-%s' % (self.seed, user_id))
+        if rng.random() < self.bot_share:
+            score = rng.uniform(BOT_THRESHOLD, 5)
+        else:
+            score = rng.uniform(0, BOT_THRESHOLD)
+        return {'display_scores': {'user': round(score, 1), 'english': round(score, 1)}}
@@ -1,13 +1,481 @@
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
-import pickle
 from tqdm import tqdm
+import multiprocessing
+import tempfile
+import argparse
+import time
 import sys
+import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from constants import TIMESAMPLES, TIMELAPSE, MIN_FRIEND_TWEETS
+from exposure_io import AFFECTS, DATA_KEYS, ExposureWriter, is_columnar, load_exposure, save_exposure
+from tweet_tables import memory_usage, read_scored_tweets
+from table_cache import TableCache
+from compressed_io import split_compression
 
 
-def calculate_exposure(users_path, friends_path, collection_time, output_path, timesamples=50, timelapse=1, verbose=False):
+ENGINES = ['sorted', 'reference']
+
+
+def empty_user_result():
+    '''
+    Create the per-user result holder, one empty list for every key of the output data dictionary.
+    '''
+    return dict((k, []) for k in DATA_KEYS)
+
+
+def parse_timelapse(timelapse):
+    '''
+    Convert a window length to a numpy timedelta.
+
+    Input:
+        timelapse: number of hours, np.timedelta64, or a pandas timedelta string such as '30m', '1h', '24h'
+    Output:
+        window: np.timedelta64 in nanoseconds
+    '''
+    if isinstance(timelapse, str):
+        try:
+            timelapse = float(timelapse)
+        except ValueError:
+            return pd.Timedelta(timelapse).to_timedelta64()
+    if isinstance(timelapse, (np.timedelta64, timedelta, pd.Timedelta)):
+        return pd.Timedelta(timelapse).to_timedelta64()
+    return pd.Timedelta(hours=timelapse).to_timedelta64()
+
+
+def timelapse_label(window):
+    '''
+    Short label of a window length for file names, e.g. '30m', '1h', '24h'.
+    '''
+    seconds = int(pd.Timedelta(window).total_seconds())
+    if seconds % 3600 == 0:
+        return '%dh' % (seconds // 3600)
+    if seconds % 60 == 0:
+        return '%dm' % (seconds // 60)
+    return '%ds' % seconds
+
+
+def build_user_index(df, column='userid'):
+    '''
+    Index rows by userid once so that each user's rows are a contiguous slice.
+    The sort is stable, so rows keep their file order within a user.
+
+    Input:
+        df: tweets dataframe
+        column: column to index on, plain or categorical with sorted categories (default 'userid')
+    Output:
+        df: dataframe sorted by column
+        index: dictionary mapping each id to its (start, stop) row offsets in df
+    '''
+    df = df.sort_values(column, kind='mergesort')
+    values = df[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # categorical ids (see tweet_tables): find the groups on the codes, then map back to ids
+        codes, starts = np.unique(values.cat.codes.values, return_index=True)
+        ids = values.cat.categories.values[codes]
+    else:
+        ids, starts = np.unique(values.values, return_index=True)
+    stops = np.append(starts[1:], len(df))
+    index = dict(zip(ids.tolist(), zip(starts.tolist(), stops.tolist())))
+    return df, index
+
+
+def user_exposure_reference(subG, allfG, timesamples=TIMESAMPLES, window=TIMELAPSE, min_friends=MIN_FRIEND_TWEETS):
+    '''
+    Original exposure computation for one user: re-filter all friend tweets for every user tweet.
+    Kept as the reference implementation for equivalence checks against the sorted engine.
+
+    Input:
+        subG: dataframe of the user's tweets
+        allfG: dataframe of the user's friends' tweets
+        timesamples: the number of data points to take per user (default 50)
+        window: np.timedelta64 window prior to each user tweet (default 1 hr)
+        min_friends: minimum number of friend tweets in the window (default 20)
+    Output:
+        result: dictionary of lists for this user (keys of DATA_KEYS)
+    '''
+    result = empty_user_result()
+
+    # loop over user tweets
+    for i in range(len(subG)):
+        # only sample at max 50
+        if len(result['usableFriends']) == timesamples:
+            break
+
+        # subset friend tweets within the window prior of users tweet
+        t1 = subG['updated_time'].values[i]
+        t2 = t1 - window
+
+        usablefG = allfG[(allfG['updated_time'] >= t2) &
+                         (allfG['updated_time'] < t1)]
+
+        # only take user tweets that have at least 20 corresponding friend tweets
+        if len(usablefG) < min_friends:
+            continue
+
+        # append data
+        result['numFriends'].append(len(allfG))
+        result['usableFriends'].append(len(usablefG))
+        result['dates'].append(t1)
+
+        friends_tote = len(usablefG)
+        for a in AFFECTS:
+            counts = sum(usablefG[a])*1.0
+            result[a].append(np.int64(subG[a].values[i]))
+            result['friend' + a + 'Counts'].append(counts)
+            result['friend' + a].append(counts / friends_tote)
+
+    return result
+
+
+def user_exposure_sorted(subG, allfG, timesamples=TIMESAMPLES, window=TIMELAPSE, min_friends=MIN_FRIEND_TWEETS):
+    '''
+    Sorted-merge exposure computation for one user.
+    Friend tweets are sorted by time once, and the 1 hr window before each user tweet is located
+    with a binary search instead of re-filtering the friend tweets. Affect counts for every window
+    come from cumulative counts over the sorted friend tweets. Produces the same result as
+    user_exposure_reference.
+
+    Input:
+        subG: dataframe of the user's tweets
+        allfG: dataframe of the user's friends' tweets
+        timesamples: the number of data points to take per user (default 50)
+        window: np.timedelta64 window prior to each user tweet (default 1 hr)
+        min_friends: minimum number of friend tweets in the window (default 20)
+    Output:
+        result: dictionary of lists for this user (keys of DATA_KEYS)
+    '''
+    return exposure_from_arrays(subG['updated_time'].values, subG[AFFECTS].values,
+                                allfG['updated_time'].values, allfG[AFFECTS].values, timesamples, window, min_friends)
+
+
+def exposure_from_arrays(uTimes, uAffects, fTimes, fAffects, timesamples=TIMESAMPLES, window=TIMELAPSE,
+                         min_friends=MIN_FRIEND_TWEETS):
+    '''
+    Array core of user_exposure_sorted, shared by the serial loop and the process pool workers.
+
+    Input:
+        uTimes: datetime64 array of the user's tweet times, in file order
+        uAffects: (n, 5) array of the user's HAP, LAP, HAN, LAN, NEU flags
+        fTimes: datetime64 array of the user's friends' tweet times
+        fAffects: (m, 5) array of the friends' HAP, LAP, HAN, LAN, NEU flags
+        timesamples: the number of data points to take per user (default 50)
+        window: np.timedelta64 window prior to each user tweet (default 1 hr)
+        min_friends: minimum number of friend tweets in the window (default 20)
+    Output:
+        result: dictionary of lists for this user (keys of DATA_KEYS)
+    '''
+    fTimes, cum = _sorted_friend_counts(fTimes, fAffects)
+
+    # window [t1 - timelapse, t1) for every user tweet
+    lo = np.searchsorted(fTimes, uTimes - window, side='left')
+    hi = np.searchsorted(fTimes, uTimes, side='left')
+
+    # only take user tweets that have at least 20 corresponding friend tweets,
+    # and only sample at max 50, in file order as the reference does
+    accepted = _first_accepted((hi - lo) >= min_friends, timesamples)
+
+    return _accepted_result(uTimes, uAffects, len(fTimes), cum, lo, hi, accepted)
+
+
+def _sorted_friend_counts(fTimes, fAffects):
+    '''
+    Sort friend tweets by time once and build cumulative affect counts, with a leading row of zeros
+    so that the counts of a window [lo, hi) are cum[hi] - cum[lo].
+    '''
+    order = np.argsort(fTimes, kind='stable')
+    fTimes = fTimes[order]
+    cum = np.zeros((len(fTimes) + 1, len(AFFECTS)), dtype=np.int64)
+    np.cumsum(fAffects[order], axis=0, dtype=np.int64, out=cum[1:])
+    return fTimes, cum
+
+
+def _first_accepted(usable, timesamples):
+    '''
+    Positions of the first timesamples user tweets with a usable window (a negative timesamples means no cap).
+    '''
+    accepted = np.flatnonzero(usable)
+    if timesamples >= 0:
+        accepted = accepted[:timesamples]
+    return accepted
+
+
+def _accepted_result(uTimes, uAffects, nFriends, cum, lo, hi, accepted):
+    '''
+    Build the result lists of one user from the windows [lo, hi) of the accepted user tweets.
+    '''
+    result = empty_user_result()
+
+    lo = lo[accepted]
+    hi = hi[accepted]
+    friends_tote = hi - lo
+
+    counts = (cum[hi] - cum[lo])*1.0
+    props = counts / friends_tote[:, None]
+
+    result['numFriends'] = [nFriends]*len(accepted)
+    result['usableFriends'] = friends_tote.tolist()
+    result['dates'] = list(uTimes[accepted])
+    for j, a in enumerate(AFFECTS):
+        result[a] = list(uAffects[accepted, j].astype(np.int64))
+        result['friend' + a + 'Counts'] = counts[:, j].tolist()
+        result['friend' + a] = props[:, j].tolist()
+
+    return result
+
+
+def sweep_from_arrays(uTimes, uAffects, fTimes, fAffects, week_start, windows, min_friends_list, timesamples_list):
+    '''
+    Compute one user's exposure for every combination of window, minimum friend tweets and sample cap,
+    sorting the friend tweets and building their cumulative counts only once.
+
+    Input:
+        uTimes: datetime64 array of all the user's tweet times, in file order (not filtered by window)
+        uAffects: (n, 5) array of the user's HAP, LAP, HAN, LAN, NEU flags
+        fTimes: datetime64 array of the user's friends' tweet times from the week before collection
+        fAffects: (m, 5) array of the friends' HAP, LAP, HAN, LAN, NEU flags
+        week_start: datetime64 of one week before collection time
+        windows: list of np.timedelta64 windows
+        min_friends_list: list of minimum numbers of friend tweets in the window
+        timesamples_list: list of numbers of data points to take per user
+    Output:
+        results: dictionary mapping (window, min_friends, timesamples) to a result dictionary
+    '''
+    fTimes, cum = _sorted_friend_counts(fTimes, fAffects)
+    hi = np.searchsorted(fTimes, uTimes, side='left')
+
+    results = {}
+    for window in windows:
+        # user tweets whose window starts after the week before collection
+        inWeek = (uTimes - window) >= week_start
+        lo = np.searchsorted(fTimes, uTimes - window, side='left')
+        for min_friends in min_friends_list:
+            usable = inWeek & ((hi - lo) >= min_friends)
+            for timesamples in timesamples_list:
+                accepted = _first_accepted(usable, timesamples)
+                results[(window, min_friends, timesamples)] = _accepted_result(uTimes, uAffects, len(fTimes),
+                                                                               cum, lo, hi, accepted)
+    return results
+
+
+# memory-mapped arrays shared with the pool workers, set by _attach_shared_arrays
+_shared_arrays = {}
+
+
+def _attach_shared_arrays(array_paths):
+    '''
+    Pool initializer: memory-map the users and friends arrays once per worker process.
+    '''
+    for name, path in array_paths.items():
+        _shared_arrays[name] = np.load(path, mmap_mode='r')
+
+
+def _exposure_shard(shard):
+    '''
+    Compute exposure for one shard of users inside a pool worker.
+    Each task only touches its own users' row ranges of the memory-mapped arrays.
+
+    Input:
+        shard: tuple of (shard number, number of shards, tasks, timesamples, window, min_friends), where tasks is a list of
+               (user position, user row start, user row stop, friend row start, friend row stop)
+    Output:
+        shard_id: shard number
+        results: list of (user position, result dictionary)
+        elapsed: seconds spent on the shard
+    '''
+    shard_id, n_shards, tasks, timesamples, window, min_friends = shard
+    start_time = time.time()
+    uTimes = _shared_arrays['uTimes']
+    uAffects = _shared_arrays['uAffects']
+    fTimes = _shared_arrays['fTimes']
+    fAffects = _shared_arrays['fAffects']
+
+    results = []
+    for s, ustart, ustop, fstart, fstop in tasks:
+        results.append((s, exposure_from_arrays(uTimes[ustart:ustop], uAffects[ustart:ustop],
+                                                fTimes[fstart:fstop], fAffects[fstart:fstop],
+                                                timesamples, window, min_friends)))
+
+    return shard_id, results, time.time() - start_time
+
+
+def split_shards(tasks, n_shards):
+    '''
+    Split user tasks (in sorted-user order) into contiguous shards of roughly equal row counts.
+
+    Input:
+        tasks: list of (user position, user row start, user row stop, friend row start, friend row stop)
+        n_shards: number of shards
+    Output:
+        shards: list of task lists
+    '''
+    if not tasks:
+        return []
+    weights = np.cumsum([(t[2] - t[1]) + (t[4] - t[3]) for t in tasks])
+    bounds = np.searchsorted(weights, weights[-1] * np.arange(1, n_shards) / float(n_shards), side='right')
+    bounds = [0] + sorted(set(bounds.tolist())) + [len(tasks)]
+    return [tasks[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def calculate_exposure_parallel(df_users, users_index, df_friends, friends_index, users, timesamples=TIMESAMPLES,
+                                workers=2, window=TIMELAPSE, min_friends=MIN_FRIEND_TWEETS):
+    '''
+    Compute exposure for all users with a process pool, sharded by userid.
+    The users and friends time and affect columns are saved once as .npy files and memory-mapped
+    by every worker, so no dataframes are pickled to the workers.
+
+    Input:
+        df_users: users tweets dataframe sorted by userid (from build_user_index)
+        users_index: userid row offsets in df_users
+        df_friends: friends tweets dataframe sorted by userid (from build_user_index)
+        friends_index: userid row offsets in df_friends
+        users: sorted list of userids; results are keyed by position in this list
+        timesamples: the number of data points to take per user (default 50)
+        workers: number of worker processes (default 2)
+        window: np.timedelta64 window prior to each user tweet (default 1 hr)
+        min_friends: minimum number of friend tweets in the window (default 20)
+    Output:
+        results: list of (user position, result dictionary), in sorted-user order
+    '''
+    tasks = [(s,) + users_index[user] + friends_index[user] for s, user in enumerate(users)
+             if user in users_index and user in friends_index]
+    shards = split_shards(tasks, workers * 4)
+
+    with tempfile.TemporaryDirectory(prefix='exposure_') as tmp_dir:
+        array_paths = {}
+        for name, values in [('uTimes', df_users['updated_time'].values),
+                             ('uAffects', df_users[AFFECTS].values),
+                             ('fTimes', df_friends['updated_time'].values),
+                             ('fAffects', df_friends[AFFECTS].values)]:
+            array_paths[name] = os.path.join(tmp_dir, name + '.npy')
+            np.save(array_paths[name], np.ascontiguousarray(values))
+
+        results = [None] * len(shards)
+        pool = multiprocessing.Pool(workers, initializer=_attach_shared_arrays, initargs=(array_paths,))
+        try:
+            for done, (shard_id, shard_results, elapsed) in enumerate(pool.imap_unordered(
+                    _exposure_shard, [(i, len(shards), shard, timesamples, window, min_friends)
+                                    for i, shard in enumerate(shards)])):
+                results[shard_id] = shard_results
+                print("shard %d/%d done (%d/%d): %d users, %d friend tweets in %.1fs" % (
+                    shard_id + 1, len(shards), done + 1, len(shards), len(shards[shard_id]),
+                    sum(t[4] - t[3] for t in shards[shard_id]), elapsed))
+        finally:
+            pool.close()
+            pool.join()
+
+    return [r for shard_results in results for r in shard_results]
+
+
+def iter_user_groups(path, chunksize, tweet_type='friend', column='userid'):
+    '''
+    Read a tweets csv in chunks and yield the rows of one userid at a time.
+    Rows of a userid that straddle a chunk boundary are carried over to the next chunk, so only one chunk
+    plus one user's rows are held in memory. Requires the csv to be sorted by userid (ascending).
+
+    Input:
+        path: path of tweets csv
+        chunksize: number of rows to read at a time
+        tweet_type: "user" or "friend" (default "friend")
+        column: column to group on (default 'userid')
+    Output:
+        generator of (userid, dataframe of that user's rows)
+    '''
+    def check_order(user, last):
+        if last is not None and user <= last:
+            raise ValueError("%s is not sorted by %s (%s after %s)" % (path, column, user, last))
+
+    # pieces of the rows of the user that is still being read
+    carry = []
+    last = None
+    for chunk in read_scored_tweets(path, tweet_type, chunksize):
+        ids = chunk[column].values
+        bounds = list(np.flatnonzero(ids[1:] != ids[:-1]) + 1)
+        if carry and carry[0][column].values[0] != ids[0]:
+            bounds.insert(0, 0)
+
+        start = 0
+        for stop in bounds:
+            # the rows before the first boundary complete the carried user
+            group = pd.concat(carry + [chunk.iloc[start:stop]]) if carry else chunk.iloc[start:stop]
+            carry = []
+            user = group[column].values[0]
+            check_order(user, last)
+            last = user
+            yield user, group
+            start = stop
+        # the last group may continue in the next chunk
+        carry.append(chunk.iloc[start:])
+
+    if carry:
+        group = pd.concat(carry) if len(carry) > 1 else carry[0]
+        user = group[column].values[0]
+        check_order(user, last)
+        yield user, group
+
+
+def calculate_exposure_streaming(users_path, friends_path, collection_time, output_path, timesamples=TIMESAMPLES,
+                                 timelapse=TIMELAPSE, chunksize=100000, engine='sorted', verbose=False,
+                                 min_friends=MIN_FRIEND_TWEETS):
+    '''
+    Out-of-core calculate_exposure: read both csv in chunks, merge them by userid as the rows go past,
+    and write each completed user's result to a columnar output straight away. Peak memory depends on
+    the chunk size and the largest single user, not on the file sizes. Results are the same as calculate_exposure.
+    Requires both csv to be sorted by userid (ascending) and date.
+
+    Input:
+        users_path: path of users tweet csv (posixPath)
+        friends_path: path of friends tweet csv (posixPath)
+        collection_time: time when tweets were collected (string, in format 'YYYY-MM-DD HH:MM:SS')
+        output_path: directory to which results are saved (columnar format, see exposure_io)
+        timesamples: the number of data points to take per user (default 50)
+        timelapse: window prior to user tweet to take corresponding friends tweets (see parse_timelapse) (default 1 hr)
+        chunksize: number of csv rows to read at a time (default 100000)
+        engine: 'sorted' or 'reference' (default 'sorted')
+        verbose: print out progress or not (default False)
+        min_friends: minimum number of friend tweets in the window (default 20)
+    Output:
+        data: ColumnarExposure of the saved results
+    '''
+    if not is_columnar(output_path):
+        raise ValueError("streaming mode writes results incrementally and needs a columnar output path, got %s" % output_path)
+    user_exposure = user_exposure_sorted if engine == 'sorted' else user_exposure_reference
+
+    # convert collection_time to datetime
+    collection_time = pd.to_datetime(collection_time, format="%Y-%m-%d %H:%M:%S")
+    week_start = collection_time - timedelta(weeks=1)
+    window = parse_timelapse(timelapse)
+
+    friend_groups = iter_user_groups(friends_path, chunksize, 'friend')
+    friend_user, allfG = next(friend_groups, (None, None))
+
+    n = 0
+    with ExposureWriter(output_path) as writer:
+        for user, subG in tqdm(iter_user_groups(users_path, chunksize, 'user'), disable=not verbose):
+            # skip friends rows of users that have no tweets
+            while friend_user is not None and friend_user < user:
+                friend_user, allfG = next(friend_groups, (None, None))
+
+            result = empty_user_result()
+            if friend_user == user:
+                # subset data collected from 1 week prior of collection date
+                fG = allfG[allfG['updated_time'] >= week_start]
+                uG = subG[(subG['updated_time'] - window) >= week_start]
+                if len(fG) and len(uG):
+                    result = user_exposure(uG, fG, timesamples, window, min_friends)
+            writer.append_user(result)
+            n += 1
+
+    if verbose:
+        print("Number of users: ", n)
+
+    return load_exposure(output_path)
+
+
+def calculate_exposure(users_path, friends_path, collection_time, output_path, timesamples=TIMESAMPLES, timelapse=TIMELAPSE, verbose=False, engine='sorted', workers=1, chunksize=None, min_friends=MIN_FRIEND_TWEETS, cache_dir=None, compression_level=None):
     """
     Read and join users and friends tweet csv.
     Requires both csv to be sorted by userid/friendid and date.
@@ -16,15 +484,97 @@ def calculate_exposure(users_path, friends_path, collection_time, output_path, t
         users_path: path of users tweet csv (posixPath)
         friends_path: path of friends tweet csv (posixPath)
         collection_time: time when tweets were collected (string, in format 'YYYY-MM-DD HH:MM:SS')
-        output_path: file path to which results are saved (REQUIRES .pkl) 
+        output_path: file path to which results are saved (.pkl for a pickle, .pkl.gz / .pkl.zst for a compressed
+                     pickle, otherwise a directory for the columnar format, see exposure_io)
         timesamples: the number of data points to take per user (default 50)
-        timelapse: the number of hours prior to user tweet to take corresponding friends tweets (default 1)
+        timelapse: window prior to user tweet to take corresponding friends tweets: a number of hours, np.timedelta64
+                   or a string such as '30m' (default 1 hr)
         verbose: print out progress or not (default False)
+        engine: 'sorted' (binary search over time-sorted friend tweets) or 'reference' (original
+                per-tweet filtering, kept for equivalence checks) (default 'sorted')
+        workers: number of processes to shard users across; requires the sorted engine (default 1)
+        chunksize: if given, stream both csv in chunks of this many rows with calculate_exposure_streaming
+                   (requires a columnar output_path and csv sorted by ascending userid) (default None)
+        min_friends: minimum number of friend tweets in the window for a user tweet to be used (default 20)
+        cache_dir: if given, parsed tables are cached there and reused by later runs (see table_cache) (default None)
+        compression_level: compression level of a compressed pickle output (default: see compressed_io)
     Output:
-        data: dictionary of nested lists
+        data: dictionary of nested lists (ColumnarExposure when streaming)
     """
-    df_users = pd.read_csv(users_path)
-    df_friends = pd.read_csv(friends_path)
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of %s, got %r" % (ENGINES, engine))
+    if workers > 1 and engine != 'sorted':
+        raise ValueError("workers > 1 requires the sorted engine")
+    if chunksize:
+        if workers > 1:
+            raise ValueError("workers > 1 is not supported in streaming mode")
+        return calculate_exposure_streaming(users_path, friends_path, collection_time, output_path, timesamples,
+                                            timelapse, chunksize, engine, verbose, min_friends)
+    user_exposure = user_exposure_sorted if engine == 'sorted' else user_exposure_reference
+    window = parse_timelapse(timelapse)
+
+    df_users, df_friends, users, week_start = load_tables(users_path, friends_path, collection_time, verbose, cache_dir)
+    n = len(users)
+
+    df_users = df_users[(df_users['updated_time'] - window) >= week_start]
+
+    # define empty cols
+    data = dict((k, [[] for i in range(n)]) for k in DATA_KEYS)
+
+    # index rows by userid once, instead of scanning both tables for every user
+    df_users, users_index = build_user_index(df_users)
+    df_friends, friends_index = build_user_index(df_friends)
+
+    # merge
+    if workers > 1:
+        for s, result in calculate_exposure_parallel(df_users, users_index, df_friends, friends_index,
+                                                     users, timesamples, workers, window, min_friends):
+            for k in DATA_KEYS:
+                data[k][s] = result[k]
+    else:
+        for s, user in tqdm(enumerate(users)):
+            if user not in friends_index or user not in users_index:
+                continue
+
+            # subset on userid
+            start, stop = users_index[user]
+            subG = df_users.iloc[start:stop]
+            start, stop = friends_index[user]
+            allfG = df_friends.iloc[start:stop]
+
+            result = user_exposure(subG, allfG, timesamples, window, min_friends)
+            for k in DATA_KEYS:
+                data[k][s] = result[k]
+
+    save_exposure(data, output_path, compression_level)
+
+    return data
+
+
+def load_tables(users_path, friends_path, collection_time, verbose=False, cache_dir=None):
+    '''
+    Read users and friends tweet csv with compact dtypes (see tweet_tables) and keep friend tweets from the week
+    before collection.
+
+    Input:
+        users_path: path of users tweet csv (posixPath)
+        friends_path: path of friends tweet csv (posixPath)
+        collection_time: time when tweets were collected (string, in format 'YYYY-MM-DD HH:MM:SS')
+        verbose: print out progress or not (default False)
+        cache_dir: if given, read the tables through a TableCache in this directory (default None)
+    Output:
+        df_users: users tweets dataframe (all times; the window-dependent filter is left to the caller)
+        df_friends: friends tweets dataframe from the week before collection
+        users: sorted list of unique userids; result positions follow this list
+        week_start: datetime of one week before collection time
+    '''
+    if cache_dir:
+        cache = TableCache(cache_dir)
+        df_users = cache.read_scored_tweets(users_path, 'user')
+        df_friends = cache.read_scored_tweets(friends_path, 'friend')
+    else:
+        df_users = read_scored_tweets(users_path, 'user')
+        df_friends = read_scored_tweets(friends_path, 'friend')
 
     # get unique users and friends lists    
     users = list(set(df_users['userid'].unique()))
@@ -32,134 +582,115 @@ def calculate_exposure(users_path, friends_path, collection_time, output_path, t
     if verbose:
         print("Number of users: ", len(users))
         print("Number of friends: ", len(friends))
-
-    n = len(users)
-
+        print("Memory of users and friends tables: %.1f MB, %.1f MB" % (memory_usage(df_users) / 1e6,
+                                                                       memory_usage(df_friends) / 1e6))
 
     # convert collection_time to datetime
     collection_time = pd.to_datetime(collection_time, format="%Y-%m-%d %H:%M:%S")
-    
-    # convert time into datetime series
-    df_users['updated_time'] = pd.to_datetime(df_users['updated_time'], format="%Y-%m-%d %H:%M:%S")
-    df_friends['updated_time'] = pd.to_datetime(df_friends['updated_time'], format="%Y-%m-%d %H:%M:%S")
+    week_start = collection_time - timedelta(weeks=1)
 
     # subset data collected from 1 week prior of collection date
-    df_friends = df_friends[df_friends['updated_time'] >= (collection_time - timedelta(weeks=1))]
-    df_users = df_users[(df_users['updated_time'] - timedelta(hours=timelapse)) >= (collection_time - timedelta(weeks=1))]
+    df_friends = df_friends[df_friends['updated_time'] >= week_start]
 
-    # define empty cols
-    yHAP = [[] for i in range(n)]
-    yLAP = [[] for i in range(n)]
-    yHAN = [[] for i in range(n)]
-    yLAN = [[] for i in range(n)]
-    yNEU = [[] for i in range(n)]
-    friendsHAPCounts = [[] for i in range(n)]
-    friendsLAPCounts = [[] for i in range(n)]
-    friendsHANCounts = [[] for i in range(n)]
-    friendsLANCounts = [[] for i in range(n)]
-    friendsNEUCounts = [[] for i in range(n)]
-    friendsHAPProp = [[] for i in range(n)]
-    friendsLAPProp = [[] for i in range(n)]
-    friendsHANProp = [[] for i in range(n)]
-    friendsLANProp = [[] for i in range(n)]
-    friendsNEUProp = [[] for i in range(n)]
-    yDates = [[] for i in range(n)]
-    numFriends = [[] for i in range(n)]
-    usableFriends = [[] for i in range(n)]
-
-    # merge
-    userid_df_friends = list(set(df_friends['userid'].unique()))
     users.sort()
-    for s, user in tqdm(enumerate(users)):
-        if user not in userid_df_friends:
+    return df_users, df_friends, users, week_start
+
+
+def sweep_output_path(output_path, window, min_friends, timesamples):
+    '''
+    Output path of one sweep combination, e.g. results.pkl -> results_1h_min20_cap50.pkl.
+    '''
+    path, compressed = split_compression(output_path)
+    root, ext = os.path.splitext(path)
+    return '%s_%s_min%d_cap%d%s%s' % (root, timelapse_label(window), min_friends, timesamples, ext, compressed)
+
+
+def calculate_exposure_sweep(users_path, friends_path, collection_time, output_path, timelapses=(TIMELAPSE,),
+                             min_friends_list=(MIN_FRIEND_TWEETS,), timesamples_list=(TIMESAMPLES,), verbose=False, cache_dir=None,
+                             compression_level=None):
+    '''
+    Parameter sweep of calculate_exposure for robustness analyses.
+    Every combination of window, minimum friend tweets and sample cap is computed from one pass over the data:
+    the tables are read, indexed and each user's friend tweets sorted and counted only once.
+    Each combination gives the same result as calculate_exposure with those parameters, and is saved to
+    sweep_output_path(output_path, window, min_friends, timesamples).
+
+    Input:
+        users_path: path of users tweet csv (posixPath)
+        friends_path: path of friends tweet csv (posixPath)
+        collection_time: time when tweets were collected (string, in format 'YYYY-MM-DD HH:MM:SS')
+        output_path: base output path (.pkl, otherwise columnar directories)
+        timelapses: list of windows (see parse_timelapse), e.g. ['30m', '1h', '3h', '24h']
+        min_friends_list: list of minimum numbers of friend tweets in the window, e.g. [10, 20]
+        timesamples_list: list of numbers of data points to take per user, e.g. [50, 100]
+        verbose: print out progress or not (default False)
+        cache_dir: if given, parsed tables are cached there and reused by later runs (see table_cache) (default None)
+        compression_level: compression level of compressed pickle outputs (default: see compressed_io)
+    Output:
+        sweep: dictionary mapping (window, min_friends, timesamples) to the data dictionary of nested lists
+    '''
+    windows = [parse_timelapse(t) for t in timelapses]
+    df_users, df_friends, users, week_start = load_tables(users_path, friends_path, collection_time, verbose, cache_dir)
+    n = len(users)
+    week_start = np.datetime64(week_start)
+
+    combinations = [(w, m, c) for w in windows for m in min_friends_list for c in timesamples_list]
+    sweep = dict((combo, dict((k, [[] for i in range(n)]) for k in DATA_KEYS)) for combo in combinations)
+
+    # index rows by userid once, instead of scanning both tables for every user
+    df_users, users_index = build_user_index(df_users)
+    df_friends, friends_index = build_user_index(df_friends)
+    uTimes = df_users['updated_time'].values
+    uAffects = df_users[AFFECTS].values
+    fTimes = df_friends['updated_time'].values
+    fAffects = df_friends[AFFECTS].values
+
+    for s, user in tqdm(enumerate(users), disable=not verbose):
+        if user not in friends_index or user not in users_index:
             continue
-      
-        # subset on userid
-        subG = df_users[df_users['userid'] == user]
-        allfG = df_friends[df_friends['userid'] == user]
-
-        # loop over user tweets
-        for i in range(len(subG)):
-            # only sample at max 50
-            if len(usableFriends[s]) == timesamples:
-                break
-
-            # subset friend tweets within 1 hr prior of users tweet
-            t1 = subG['updated_time'].values[i]
-            t2 = t1 - np.timedelta64(1, 'h')
-
-            usablefG = allfG[(allfG['updated_time'] >= t2) & 
-                             (allfG['updated_time'] < t1)]
-
-            # only take user tweets that have at least 20 corresponding friend tweets
-            if len(usablefG) < 20:
-                continue
+        ustart, ustop = users_index[user]
+        fstart, fstop = friends_index[user]
+        results = sweep_from_arrays(uTimes[ustart:ustop], uAffects[ustart:ustop], fTimes[fstart:fstop],
+                                    fAffects[fstart:fstop], week_start, windows, min_friends_list, timesamples_list)
+        for combo, result in results.items():
+            for k in DATA_KEYS:
+                sweep[combo][k][s] = result[k]
 
-            # append data
-            numFriends[s].append(len(allfG))
-            usableFriends[s].append(len(usablefG))
-            yDates[s].append(t1)
-
-            HAPCounts = sum(usablefG['HAP'])*1.0
-            LAPCounts = sum(usablefG['LAP'])*1.0
-            HANCounts = sum(usablefG['HAN'])*1.0
-            LANCounts = sum(usablefG['LAN'])*1.0
-            NEUCounts = sum(usablefG['NEU'])*1.0
-
-            friendsHAPCounts[s].append(HAPCounts)
-            friendsLAPCounts[s].append(LAPCounts) 
-            friendsHANCounts[s].append(HANCounts)
-            friendsLANCounts[s].append(LANCounts) 
-            friendsNEUCounts[s].append(NEUCounts)
-            
-            yHAP[s].append(subG['HAP'].values[i])
-            yLAP[s].append(subG['LAP'].values[i])
-            yHAN[s].append(subG['HAN'].values[i])
-            yLAN[s].append(subG['LAN'].values[i])
-            yNEU[s].append(subG['NEU'].values[i])
-                
-            friends_tote = len(usablefG)
-
-            friendsHAPProp[s].append(HAPCounts / friends_tote)
-            friendsLAPProp[s].append(LAPCounts / friends_tote)
-            friendsHANProp[s].append(HANCounts / friends_tote)
-            friendsLANProp[s].append(LANCounts / friends_tote)
-            friendsNEUProp[s].append(NEUCounts / friends_tote)
-
-
-    data = {
-        "numFriends": numFriends,
-        "usableFriends": usableFriends,
-        "dates": yDates,
-        "HAP": yHAP,
-        "LAP": yLAP,
-        "HAN": yHAN,
-        "LAN": yLAN,
-        "NEU": yNEU,
-        "friendHAP": friendsHAPProp,
-        "friendLAP": friendsLAPProp,
-        "friendHAN": friendsHANProp,
-        "friendLAN": friendsLANProp,
-        "friendNEU": friendsNEUProp,
-        "friendHAPCounts": friendsHAPCounts,
-        "friendLAPCounts": friendsLAPCounts,
-        "friendHANCounts": friendsHANCounts,
-        "friendLANCounts": friendsLANCounts,
-        "friendNEUCounts": friendsNEUCounts
-    }
-
-    with open(output_path, 'w') as f:
-        pickle.dump(data, f)
+    for (window, min_friends, timesamples), data in sweep.items():
+        save_exposure(data, sweep_output_path(output_path, window, min_friends, timesamples), compression_level)
 
-    return data
+    return sweep
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 5:
-        calculate_exposure(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
-    elif len(sys.argv) == 6:
-        calculate_exposure(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
-    elif len(sys.argv) == 7:
-        calculate_exposure(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6])
+    parser = argparse.ArgumentParser(description="Calculate friends' affective exposure for each user tweet.")
+    parser.add_argument('users_path')
+    parser.add_argument('friends_path')
+    parser.add_argument('collection_time')
+    parser.add_argument('output_path')
+    parser.add_argument('timesamples', nargs='?', type=int, default=TIMESAMPLES)
+    parser.add_argument('timelapse', nargs='?', default=TIMELAPSE, help="hours, or a string such as '30m'")
+    parser.add_argument('verbose', nargs='?', type=lambda v: v.lower() in ('1', 'true', 'yes'), default=False)
+    parser.add_argument('--engine', choices=ENGINES, default='sorted')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='stream both csv in chunks of this many rows (columnar output, csv sorted by userid)')
+    parser.add_argument('--min-friends', type=int, default=MIN_FRIEND_TWEETS)
+    parser.add_argument('--cache-dir', help='cache parsed tables in this directory for later runs')
+    parser.add_argument('--sweep-timelapse', nargs='+', help="sweep over windows, e.g. 30m 1h 3h 24h")
+    parser.add_argument('--sweep-min-friends', nargs='+', type=int, help="sweep over minimum friend tweets")
+    parser.add_argument('--sweep-timesamples', nargs='+', type=int, help="sweep over sample caps")
+    parser.add_argument('--compression-level', type=int, help='level of a .pkl.gz / .pkl.zst output')
+    args = parser.parse_args()
+
+    if args.sweep_timelapse or args.sweep_min_friends or args.sweep_timesamples:
+        calculate_exposure_sweep(args.users_path, args.friends_path, args.collection_time, args.output_path,
+                                 args.sweep_timelapse or [args.timelapse],
+                                 args.sweep_min_friends or [args.min_friends],
+                                 args.sweep_timesamples or [args.timesamples], args.verbose, args.cache_dir,
+                                 args.compression_level)
     else:
-        calculate_exposure(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6], sys.argv[7])
+        calculate_exposure(args.users_path, args.friends_path, args.collection_time, args.output_path,
+                           args.timesamples, args.timelapse, args.verbose, engine=args.engine, workers=args.workers,
+                           chunksize=args.chunksize, min_friends=args.min_friends, cache_dir=args.cache_dir,
+                           compression_level=args.compression_level)
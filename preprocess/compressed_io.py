@@ -0,0 +1,88 @@
+import gzip
+import io
+
+
+# file extensions of the supported compressions and their default levels
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+
+def compression_of(path):
+    '''
+    Compression of a path from its extension: "gzip" (.gz), "zstd" (.zst) or None.
+    '''
+    path = str(path)
+    for ext, compression in COMPRESSIONS.items():
+        if path.endswith(ext):
+            return compression
+    return None
+
+
+def strip_compression(path):
+    '''
+    Path without its compression extension, e.g. results.pkl.gz -> results.pkl.
+    '''
+    path = str(path)
+    for ext in COMPRESSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def split_compression(path):
+    '''
+    (path without its compression extension, compression extension or '')
+    '''
+    stripped = strip_compression(path)
+    return stripped, str(path)[len(stripped):]
+
+
+def _zstandard():
+    # optional dependency, only needed for .zst files
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is needed to read and write .zst files (pip install zstandard)")
+    return zstandard
+
+
+def open_file(path, mode='r', compression='infer', level=None, encoding='utf-8', errors=None, newline=None):
+    '''
+    Open a plain, gzip or zstd file as a stream, like open.
+
+    Input:
+        path: file path
+        mode: 'r', 'w', 'rb' or 'wb' ('r' and 'w' open text) (default 'r')
+        compression: "gzip", "zstd", None, or "infer" from the extension of path (default "infer")
+        level: compression level when writing (default 6 for gzip, 3 for zstd)
+        encoding, errors, newline: as for open, in text mode
+    Output:
+        file object
+    '''
+    path = str(path)
+    if compression == 'infer':
+        compression = compression_of(path)
+    binary = 'b' in mode
+    writing = mode[0] in 'wa'
+    raw_mode = mode[0] + 'b'
+    text = {} if binary else {'encoding': encoding, 'errors': errors, 'newline': newline}
+
+    if compression is None:
+        return open(path, mode, **text)
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+
+    if compression == 'gzip':
+        stream = gzip.open(path, raw_mode, compresslevel=level) if writing else gzip.open(path, raw_mode)
+    elif compression == 'zstd':
+        zstandard = _zstandard()
+        if writing:
+            stream = zstandard.ZstdCompressor(level=level).stream_writer(open(path, raw_mode), closefd=True)
+        else:
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    else:
+        raise ValueError("Unknown compression %r" % compression)
+
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, **text)
@@ -0,0 +1,91 @@
+# coding: utf-8
+import pandas as pd
+import emoji
+import time
+import sys
+import os
+import re
+
+
+def emoji_characters():
+    '''
+    Single-character emoji of the installed emoji package (emoji.EMOJI_DATA, or emoji.UNICODE_EMOJI before 2.0).
+    '''
+    table = getattr(emoji, 'EMOJI_DATA', None)
+    if table is None:
+        table = emoji.UNICODE_EMOJI
+        if 'en' in table:
+            # emoji 1.x: one table per language
+            table = table['en']
+    return sorted(c for c in table if len(c) == 1)
+
+
+# translation of every emoji to itself surrounded by spaces, of carriage returns and tabs to spaces, and removal
+# of newlines (the character regex of the Python 2 script skipped them, as . does not match a newline)
+EMOJI_TABLE = dict((ord(c), ' ' + c + ' ') for c in emoji_characters())
+EMOJI_TABLE.update(str.maketrans('\r\t', '  ', '\n'))
+WHITESPACE_TABLE = str.maketrans('\r\t', '  ', '\n')
+WHITESPACE_RE = re.compile('[\n\r\t]')
+
+
+def normalize_message(message):
+    '''
+    Prepare a message for English SentiStrength: surround every emoji with spaces, so it is scored as a word,
+    turn carriage returns and tabs into spaces and drop newlines, so the message is one line.
+    No emoji is ASCII, so ASCII messages only need the whitespace replaced, and most need nothing.
+    '''
+    if message.isascii():
+        return message.translate(WHITESPACE_TABLE) if WHITESPACE_RE.search(message) else message
+    return message.translate(EMOJI_TABLE)
+
+
+def normalize_messages(messages):
+    '''
+    normalize_message over a series of messages. Missing messages become "nan".
+
+    Input:
+        messages: series of messages
+    Output:
+        series of normalized messages
+    '''
+    return pd.Series([normalize_message(m) for m in messages.fillna('nan').astype(str)],
+                     index=messages.index, dtype=object)
+
+
+def normalize_file(input_file_path, output_path, chunksize=200000, buffer_size=16 * 1024 * 1024, verbose=True):
+    '''
+    Normalize the messages of a raw tweets csv into a file with one message per line, in chunks.
+    The output is written to a temporary file that replaces output_path only once complete.
+
+    Input:
+        input_file_path: file path to the file with raw text (REQUIRES ending with '.csv')
+        output_path: file to which normalized messages are saved (e.g. [output folder]/output_messages.txt)
+        chunksize: number of messages normalized at a time (default 200000)
+        buffer_size: write buffer in bytes (default 16 MB)
+        verbose: print the number of lines per second or not (default True)
+    Output:
+        n_lines: number of lines written
+    '''
+    start_time = time.time()
+    n_lines = 0
+    tmp_path = output_path + '.tmp%d' % os.getpid()
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', buffering=buffer_size) as f:
+            for chunk in pd.read_csv(input_file_path, usecols=['message'], dtype={'message': object}, chunksize=chunksize):
+                lines = normalize_messages(chunk['message'])
+                if len(lines):
+                    f.write('\n'.join(lines) + '\n')
+                n_lines += len(lines)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if verbose:
+        elapsed = time.time() - start_time
+        print("Normalized %d messages in %.1fs (%.0f lines/s)" % (n_lines, elapsed, n_lines / max(elapsed, 1e-9)))
+    return n_lines
+
+
+if __name__ == '__main__':
+    normalize_file(sys.argv[1], sys.argv[2])
@@ -0,0 +1,292 @@
+import numpy as np
+import pandas as pd
+import itertools
+import pickle
+import shutil
+import os
+
+from compressed_io import open_file, strip_compression
+
+
+AFFECTS = ['HAP', 'LAP', 'HAN', 'LAN', 'NEU']
+
+DATA_KEYS = ["numFriends", "usableFriends", "dates",
+             "HAP", "LAP", "HAN", "LAN", "NEU",
+             "friendHAP", "friendLAP", "friendHAN", "friendLAN", "friendNEU",
+             "friendHAPCounts", "friendLAPCounts", "friendHANCounts", "friendLANCounts", "friendNEUCounts"]
+
+# dtype of each flat column in the columnar format
+COLUMN_DTYPES = {
+    "numFriends": np.int64,
+    "usableFriends": np.int64,
+    "dates": np.dtype('datetime64[ns]'),
+}
+for a in AFFECTS:
+    COLUMN_DTYPES[a] = np.uint8
+    COLUMN_DTYPES['friend' + a] = np.float64
+    COLUMN_DTYPES['friend' + a + 'Counts'] = np.float64
+
+OFFSETS_FILE = 'offsets.npy'
+PROVENANCE_FILE = 'provenance.csv'
+PROVENANCE_COLUMNS = ['sample', 'source', 'user_offset', 'n_users', 'value_offset', 'n_values']
+
+
+class RaggedColumn(object):
+    '''
+    One key of a columnar exposure result: a flat array split into users by the offsets array.
+    Indexing by user position returns that user's values, like the nested lists of the pickle format.
+    '''
+
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, s):
+        if s < 0:
+            s += len(self)
+        return self.values[self.offsets[s]:self.offsets[s + 1]]
+
+    def __iter__(self):
+        for s in range(len(self)):
+            yield self[s]
+
+
+class ColumnarExposure(object):
+    '''
+    Read-only view of a columnar exposure result directory, with the same keys as the pickled data dictionary.
+    Columns are memory-mapped and only opened when first accessed.
+
+    Input:
+        path: columnar exposure directory (written by ExposureWriter or save_exposure)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = load_array(os.path.join(path, OFFSETS_FILE))
+        self._columns = {}
+
+    def keys(self):
+        return list(DATA_KEYS)
+
+    def __contains__(self, key):
+        return key in DATA_KEYS
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(DATA_KEYS)
+
+    def __getitem__(self, key):
+        return RaggedColumn(self.flat(key), self.offsets)
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def flat(self, key):
+        '''
+        Return all users' values of one key as a single (memory-mapped) array.
+        '''
+        if key not in DATA_KEYS:
+            raise KeyError(key)
+        if key not in self._columns:
+            self._columns[key] = load_array(os.path.join(self.path, key + '.npy'))
+        return self._columns[key]
+
+
+class ExposureWriter(object):
+    '''
+    Write exposure results to a columnar directory one user at a time: one flat .npy file per key
+    plus an offsets array marking where each user's values start. Values are appended to raw
+    files as they arrive and turned into .npy files on close, so memory does not grow with the output.
+
+    Input:
+        path: output directory
+    '''
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.offsets = [0]
+        self._files = dict((k, open(os.path.join(path, k + '.bin'), 'wb')) for k in DATA_KEYS)
+
+    def append_user(self, result):
+        '''
+        Append one user's result (dictionary of lists with the keys of DATA_KEYS; empty lists for skipped users).
+        '''
+        n = len(result['usableFriends'])
+        for k in DATA_KEYS:
+            values = np.asarray(result[k], dtype=COLUMN_DTYPES[k])
+            if len(values) != n:
+                raise ValueError("user has %d values for %s but %d for usableFriends" % (len(values), k, n))
+            self._files[k].write(values.tobytes())
+        self.offsets.append(self.offsets[-1] + n)
+
+    def append_data(self, data):
+        '''
+        Append every user of a data dictionary of nested lists, or of a ColumnarExposure.
+        '''
+        if isinstance(data, ColumnarExposure):
+            self.append_columnar(data)
+            return
+        for s in range(len(data['usableFriends'])):
+            self.append_user(dict((k, data[k][s]) for k in DATA_KEYS))
+
+    def append_columnar(self, data, chunk_size=1000000):
+        '''
+        Append a ColumnarExposure by copying its flat columns in chunks, without splitting it into users.
+        '''
+        for k in DATA_KEYS:
+            values = data.flat(k)
+            for i in range(0, len(values), chunk_size):
+                self._files[k].write(np.asarray(values[i:i + chunk_size], dtype=COLUMN_DTYPES[k]).tobytes())
+        base = self.offsets[-1]
+        self.offsets.extend((base + np.asarray(data.offsets[1:], dtype=np.int64)).tolist())
+
+    def close(self):
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        for k in DATA_KEYS:
+            self._files[k].close()
+            bin_path = os.path.join(self.path, k + '.bin')
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(COLUMN_DTYPES[k])),
+                      'fortran_order': False,
+                      'shape': (self.offsets[-1],)}
+            with open(os.path.join(self.path, k + '.npy'), 'wb') as fw:
+                np.lib.format.write_array_header_1_0(fw, header)
+                with open(bin_path, 'rb') as fr:
+                    shutil.copyfileobj(fr, fw, 16 * 1024 * 1024)
+            os.remove(bin_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_array(path):
+    '''
+    Memory-map a .npy file.
+    '''
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # older numpy cannot memory-map zero-length arrays
+        return np.load(path)
+
+
+def is_columnar(path):
+    '''
+    Columnar results are directories; anything else is treated as a pickle (.pkl, or .pkl.gz / .pkl.zst).
+    '''
+    return not strip_compression(path).endswith('.pkl')
+
+
+def save_exposure(data, output_path, compression_level=None):
+    '''
+    Save exposure results.
+
+    Input:
+        data: dictionary of nested lists (output of calculate_exposure)
+        output_path: file path ending in .pkl for a pickle (.pkl.gz or .pkl.zst to compress it),
+                     otherwise a directory for the columnar format
+        compression_level: compression level of a compressed pickle (default: see compressed_io)
+    Output:
+        None
+    '''
+    if not is_columnar(output_path):
+        with open_file(output_path, 'wb', level=compression_level) as f:
+            pickle.dump(data, f)
+        return
+
+    with ExposureWriter(output_path) as writer:
+        writer.append_data(data)
+
+
+def load_exposure(path):
+    '''
+    Load exposure results saved by save_exposure.
+
+    Input:
+        path: .pkl file (optionally .gz / .zst compressed) or columnar directory
+    Output:
+        data: dictionary of nested lists, or ColumnarExposure with the same keys
+    '''
+    if os.path.isdir(str(path)):
+        return ColumnarExposure(path)
+    return pd.read_pickle(path)
+
+
+def provenance_path(path):
+    '''
+    Location of the per-sample provenance table of an aggregated result:
+    inside a columnar directory, or next to a pickle as <name>_provenance.csv.
+    '''
+    path = str(path)
+    if is_columnar(path):
+        return os.path.join(path, PROVENANCE_FILE)
+    return strip_compression(path)[:-len('.pkl')] + '_provenance.csv'
+
+
+def save_provenance(rows, output_path):
+    '''
+    Save the per-sample provenance of an aggregated result.
+
+    Input:
+        rows: list of dictionaries with the keys of PROVENANCE_COLUMNS
+        output_path: path of the aggregated result (.pkl or columnar directory)
+    Output:
+        None
+    '''
+    pd.DataFrame(rows, columns=PROVENANCE_COLUMNS).to_csv(provenance_path(output_path), index=False)
+
+
+def load_provenance(path):
+    '''
+    Load the per-sample provenance of an aggregated result.
+    Users of a sample are positions user_offset to user_offset + n_users of every key;
+    in the columnar format its flat values are value_offset to value_offset + n_values.
+
+    Input:
+        path: path of the aggregated result (.pkl or columnar directory)
+    Output:
+        provenance: dataframe with PROVENANCE_COLUMNS, one row per sample
+    '''
+    return pd.read_csv(provenance_path(path), dtype={'sample': str})
+
+
+def sample_users(path, samples):
+    '''
+    User positions of an aggregated result that came from the given samples (collection waves).
+
+    Input:
+        path: path of the aggregated result (.pkl or columnar directory)
+        samples: list of sample names
+    Output:
+        positions: sorted array of user positions
+    '''
+    provenance = load_provenance(path)
+    provenance = provenance[provenance['sample'].isin(samples)]
+    ranges = [np.arange(o, o + n) for o, n in zip(provenance['user_offset'], provenance['n_users'])]
+    if not ranges:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(ranges)
+
+
+def flatten(data, key):
+    '''
+    Concatenate all users' values of one key.
+
+    Input:
+        data: output of load_exposure
+        key: one of DATA_KEYS
+    Output:
+        values: flat list (pickle format) or memory-mapped array (columnar format)
+    '''
+    if isinstance(data, ColumnarExposure):
+        return data.flat(key)
+    return list(itertools.chain.from_iterable(data[key]))
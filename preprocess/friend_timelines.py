@@ -0,0 +1,413 @@
+import aiohttp
+import asyncio
+import datetime
+import random
+import math
+import time
+import csv
+
+from timeline_store import TIMELINE_COUNT, twitter_time
+
+
+DEFAULT_BASE_URL = 'https://api.twitter.com'
+TOKEN_ENDPOINT = '/oauth2/token'
+RATE_LIMIT_ENDPOINT = '/1.1/application/rate_limit_status.json'
+TIMELINE_ENDPOINT = '/1.1/statuses/user_timeline.json'
+
+# app-auth limit of user_timeline: 1500 requests per 15 minute window
+WINDOW_LIMIT = 1500
+WINDOW_SECONDS = 900
+
+# user_timeline only reaches back this many statuses of a user
+MAX_TIMELINE_STATUSES = 3200
+
+# statuses of these users cannot be read (protected, suspended or deleted accounts)
+INACCESSIBLE_STATUS = (401, 403, 404)
+
+
+class TokenBucket(object):
+    '''
+    Rate limiter shared by all requests of a collector: a bucket of capacity tokens that refills at capacity per
+    period seconds, and takes one token per request. The bucket follows the rate-limit window the API reports
+    (see update): it never holds more tokens than the requests left in the window, refills at the rate that spreads
+    them over the rest of the window, and stays empty until the window resets once none are left.
+
+    Input:
+        capacity: requests per window (default 1500)
+        period: window length in seconds (default 900)
+    '''
+
+    def __init__(self, capacity=WINDOW_LIMIT, period=WINDOW_SECONDS):
+        self.capacity = float(capacity)
+        self.rate = capacity / float(period)
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._blocked_until and now >= self._blocked_until:
+            # the window was reset
+            self.tokens = self.capacity
+            self._updated = self._blocked_until
+            self._blocked_until = 0.0
+        if now >= self._blocked_until:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    async def acquire(self):
+        '''
+        Wait for a token. Waiting requests are served in order.
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = self._refill()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update(self, remaining, reset):
+        '''
+        Follow the rate-limit window reported by the API.
+
+        Input:
+            remaining: requests left in the window
+            reset: time the window resets, in epoch seconds
+        '''
+        self._refill()
+        self.tokens = min(self.tokens, max(remaining, 0))
+        if remaining <= 0:
+            self.block_until(reset)
+        else:
+            # spread the requests left over the rest of the window
+            self.rate = remaining / max(reset - time.time(), 1.0)
+
+    def block_until(self, reset):
+        '''
+        Hand out no token before reset (epoch seconds); the bucket is full again after it.
+        '''
+        self._refill()
+        self._blocked_until = max(self._blocked_until, time.monotonic() + max(reset - time.time(), 0))
+        self.tokens = 0.0
+
+    def update_from_headers(self, headers):
+        remaining = _header_int(headers, 'x-rate-limit-remaining')
+        reset = _header_int(headers, 'x-rate-limit-reset')
+        if remaining is not None and reset is not None:
+            self.update(remaining, reset)
+
+
+def _header_int(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def backoff(attempt, base=1.0, cap=60.0):
+    '''
+    Seconds to wait before retry number attempt (from 0): "full jitter" exponential backoff, uniform between 0
+    and base * 2 ** attempt (at most cap), so failed requests do not all retry at once.
+    '''
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TimelineFetcher(object):
+    '''
+    Concurrent user_timeline requests with application-only auth, a shared TokenBucket, and retries.
+    A 429 answer empties the bucket until the window resets (or for its Retry-After) and is retried; server and
+    connection errors are retried after a jittered backoff, up to max_retries times.
+
+    Input:
+        session: aiohttp.ClientSession
+        bearer_token: application-only bearer token (see get_bearer_token)
+        base_url: API root (default https://api.twitter.com), e.g. the url of a mock server
+        bucket: TokenBucket (default: one full bucket of 1500 requests per 15 minutes)
+        max_retries: retries of a request after server or connection errors (default 5)
+        backoff_base: backoff of the first retry in seconds (default 1)
+    '''
+
+    def __init__(self, session, bearer_token, base_url=DEFAULT_BASE_URL, bucket=None, max_retries=5, backoff_base=1.0):
+        self.session = session
+        self.headers = {'Authorization': 'Bearer ' + bearer_token}
+        self.base_url = base_url.rstrip('/')
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.bytes = 0
+
+    async def sync_rate_limit(self):
+        '''
+        Start the bucket from the user_timeline window reported by the rate limit endpoint.
+        '''
+        async with self.session.get(self.base_url + RATE_LIMIT_ENDPOINT, params={'resources': 'statuses'},
+                                    headers=self.headers) as resp:
+            resp.raise_for_status()
+            limits = (await resp.json())['resources']['statuses']['/statuses/user_timeline']
+        self.bucket.capacity = float(limits['limit'])
+        self.bucket.update(int(limits['remaining']), int(limits['reset']))
+
+    async def get(self, endpoint, params, sizes=None):
+        '''
+        Input:
+            endpoint: API path, e.g. TIMELINE_ENDPOINT
+            params: query parameters
+            sizes: list to which the size in bytes of every answer is appended (default None)
+        Output:
+            decoded JSON answer, or None if the API answers that it is inaccessible (401, 403, 404)
+        '''
+        attempt = 0
+        limited = 0
+        while True:
+            await self.bucket.acquire()
+            self.requests += 1
+            try:
+                async with self.session.get(self.base_url + endpoint, params=params, headers=self.headers) as resp:
+                    self.bucket.update_from_headers(resp.headers)
+                    body = await resp.read()
+                    self.bytes += len(body)
+                    if sizes is not None:
+                        sizes.append(len(body))
+                    if resp.status == 200:
+                        return await resp.json(content_type=None)
+                    if resp.status == 429:
+                        # retried without counting as an attempt: the bucket waits for the window to reset
+                        # (or Retry-After), or backs off if the answer has no reset time ahead
+                        self.rate_limited += 1
+                        limited += 1
+                        reset = _header_int(resp.headers, 'x-rate-limit-reset')
+                        retry_after = _header_int(resp.headers, 'retry-after')
+                        if retry_after is not None:
+                            reset = max(reset or 0, time.time() + retry_after)
+                        if reset is None or reset <= time.time():
+                            reset = time.time() + backoff(min(limited, 10), self.backoff_base)
+                        self.bucket.block_until(reset)
+                        continue
+                    if resp.status in INACCESSIBLE_STATUS:
+                        return None
+                    if resp.status < 500:
+                        resp.raise_for_status()
+                    error = aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status,
+                                                        message=resp.reason)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(backoff(attempt, self.backoff_base))
+            attempt += 1
+
+    async def user_timeline(self, user_id, count=TIMELINE_COUNT, since_id=None):
+        '''
+        Input:
+            user_id: user id
+            count: number of statuses (at most 200)
+            since_id: only statuses newer than this status id (default None: the newest statuses)
+        Output:
+            list of status dictionaries (newest first), or None if the timeline is inaccessible
+        '''
+        params = {'user_id': str(user_id), 'trim_user': 'true', 'exclude_replies': 'true', 'count': str(count)}
+        if since_id is not None:
+            params['since_id'] = str(since_id)
+        return await self.get(TIMELINE_ENDPOINT, params)
+
+    async def timeline_window(self, user_id, start, since_id=None, count=TIMELINE_COUNT):
+        '''
+        Page back through a timeline (max_id cursor) until its statuses are older than start, so exactly the
+        statuses from start to now are fetched: one page for quiet accounts, as many as needed for active ones.
+        Paging also stops at the statuses already known (since_id), and at the end of the timeline.
+
+        Input:
+            user_id: user id
+            start: oldest status time wanted ('YYYY-MM-DD HH:MM:SS', UTC)
+            since_id: only statuses newer than this status id (default None)
+            count: statuses per page (at most 200)
+        Output:
+            statuses: list of status dictionaries from start on (newest first), or None if the timeline is inaccessible
+            pages: dictionary of counters: requests, bytes, statuses fetched, outside (statuses fetched from
+                   before start), and requests_saved, bytes_saved (pages up to the 3200 statuses user_timeline
+                   reaches back that were not requested because paging stopped at start, estimated at the mean size
+                   of the pages fetched; 0 with since_id, which would have stopped paging anyway)
+        '''
+        params = {'user_id': str(user_id), 'trim_user': 'true', 'exclude_replies': 'true', 'count': str(count)}
+        if since_id is not None:
+            params['since_id'] = str(since_id)
+        statuses = []
+        sizes = []
+        fetched = 0
+        stopped_at_start = False
+        while fetched < MAX_TIMELINE_STATUSES:
+            page = await self.get(TIMELINE_ENDPOINT, params, sizes)
+            if page is None:
+                return None, {'requests': len(sizes), 'bytes': sum(sizes), 'statuses': fetched, 'outside': 0,
+                              'requests_saved': 0, 'bytes_saved': 0}
+            if not page:
+                # end of the timeline, or nothing newer than since_id
+                break
+            fetched += len(page)
+            inside = [status for status in page if twitter_time(status['created_at']) >= start]
+            statuses.extend(inside)
+            if len(inside) < len(page):
+                stopped_at_start = True
+                break
+            params['max_id'] = str(min(int(status['id']) for status in page) - 1)
+
+        pages = {'requests': len(sizes), 'bytes': sum(sizes), 'statuses': fetched, 'outside': fetched - len(statuses),
+                 'requests_saved': 0, 'bytes_saved': 0}
+        if stopped_at_start and since_id is None:
+            pages['requests_saved'] = int(math.ceil(max(MAX_TIMELINE_STATUSES - fetched, 0) / float(count)))
+            pages['bytes_saved'] = int(pages['requests_saved'] * pages['bytes'] / max(pages['requests'], 1))
+        return statuses, pages
+
+
+async def get_bearer_token(session, consumer_key, consumer_secret, base_url=DEFAULT_BASE_URL):
+    '''
+    Application-only bearer token of the consumer key and secret.
+    '''
+    async with session.post(base_url.rstrip('/') + TOKEN_ENDPOINT, data={'grant_type': 'client_credentials'},
+                            auth=aiohttp.BasicAuth(consumer_key, consumer_secret)) as resp:
+        resp.raise_for_status()
+        return (await resp.json(content_type=None))['access_token']
+
+
+def status_rows(friend, user, statuses, lang):
+    '''
+    Rows of the friends statuses csv (friendid, userid, message, updated_time) for the statuses in lang.
+    '''
+    return [[friend, user, status['text'], twitter_time(status['created_at'])]
+            for status in statuses if status.get('lang') == lang]
+
+
+def window_start(collection_time=None, weeks=1):
+    '''
+    Start of the friend statuses calculate_exposure uses: one week before the collection time.
+
+    Input:
+        collection_time: UTC datetime (default now)
+        weeks: window length in weeks (default 1)
+    Output:
+        start time ('YYYY-MM-DD HH:MM:SS', UTC)
+    '''
+    if collection_time is None:
+        collection_time = datetime.datetime.now(datetime.timezone.utc)
+    return (collection_time - datetime.timedelta(weeks=weeks)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+async def fetch_friend_timelines(user, friends, output_path, lang, consumer_key, consumer_secret, base_url=DEFAULT_BASE_URL,
+                                 concurrency=16, max_retries=5, backoff_base=1.0, store=None, max_age=0, start=None,
+                                 verbose=True):
+    '''
+    Fetch the timelines of a user's friends concurrently and append their statuses in lang to output_path, friend
+    by friend in the order of friends (as the sequential loop of twitter_collection.py did).
+    With a TimelineStore, stored friends are only asked for their statuses newer than the stored ones (since_id),
+    and the rows are written from the store. With max_age, friends fetched less than max_age seconds ago are
+    written from the store without a request, so they miss the statuses posted since.
+    With a start time, every timeline is paged back to start (see TimelineFetcher.timeline_window) and only the
+    statuses from start on are written, instead of one page of the 200 newest statuses.
+
+    Input:
+        user: user id
+        friends: list of friend ids
+        output_path: friends statuses csv (friendid,userid,message,updated_time)
+        lang: status language, "en" or "ja"
+        consumer_key, consumer_secret: app keys
+        base_url: API root (default https://api.twitter.com), e.g. the url of a mock server
+        concurrency: number of requests in flight (default 16)
+        max_retries: retries of a request after server or connection errors (default 5)
+        backoff_base: backoff of the first retry in seconds (default 1)
+        store: TimelineStore (default None)
+        max_age: seconds a stored timeline is used without a request (default 0: always fetch new statuses)
+        start: oldest status time written ('YYYY-MM-DD HH:MM:SS', UTC, see window_start) (default None: the 200
+               newest statuses)
+        verbose: print progress or not (default True)
+    Output:
+        dictionary of counters: friends, inaccessible, failed (still failing after max_retries), statuses,
+        stored (friends written from the store without a request), deltas (since_id requests),
+        requests, rate_limited, retries, bytes, and with a start time outside (statuses fetched from before start),
+        requests_saved and bytes_saved (see TimelineFetcher.timeline_window)
+    '''
+    counts = {'friends': len(friends), 'inaccessible': 0, 'failed': 0, 'statuses': 0, 'stored': 0, 'deltas': 0,
+              'outside': 0, 'requests_saved': 0, 'bytes_saved': 0}
+    async with aiohttp.ClientSession() as session:
+        fetcher = TimelineFetcher(session, await get_bearer_token(session, consumer_key, consumer_secret, base_url),
+                                  base_url, max_retries=max_retries, backoff_base=backoff_base)
+        await fetcher.sync_rate_limit()
+
+        todo = asyncio.Queue()
+        for i, friend in enumerate(friends):
+            todo.put_nowait((i, friend))
+        done = {}
+        ready = asyncio.Event()
+
+        async def work():
+            while not todo.empty():
+                i, friend = todo.get_nowait()
+                try:
+                    state = store.state(friend) if store is not None else None
+                    if state is not None and time.time() - state[1] < max_age:
+                        counts['stored'] += 1
+                        done[i] = [] if not state[2] else None
+                    else:
+                        since_id = state[0] if state is not None else None
+                        counts['deltas'] += since_id is not None
+                        if start is not None:
+                            statuses, pages = await fetcher.timeline_window(friend, start, since_id=since_id)
+                            for key in ('outside', 'requests_saved', 'bytes_saved'):
+                                counts[key] += pages[key]
+                        else:
+                            statuses = await fetcher.user_timeline(friend, since_id=since_id)
+                        if store is not None:
+                            store.add(friend, statuses)
+                        done[i] = statuses
+                except Exception as e:
+                    print('At sub %s, error %s' % (str(friend), e))
+                    done[i] = e
+                ready.set()
+
+        workers = [asyncio.ensure_future(work()) for _ in range(min(concurrency, len(friends)))]
+        try:
+            with open(output_path, 'a', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                for i, friend in enumerate(friends):
+                    while i not in done:
+                        ready.clear()
+                        await ready.wait()
+                    statuses = done.pop(i)
+                    if statuses is None:
+                        counts['inaccessible'] += 1
+                    elif isinstance(statuses, Exception):
+                        counts['failed'] += 1
+                    else:
+                        if store is not None:
+                            rows = store.rows(friend, user, lang, start=start)
+                        else:
+                            rows = status_rows(friend, user, statuses, lang)
+                        writer.writerows(rows)
+                        counts['statuses'] += len(rows)
+                    if verbose and (i + 1) % 100 == 0:
+                        print(i + 1)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    counts.update(requests=fetcher.requests, rate_limited=fetcher.rate_limited, retries=fetcher.retries, bytes=fetcher.bytes)
+    return counts
+
+
+def collect_friend_timelines(*args, **kwargs):
+    '''
+    Blocking fetch_friend_timelines, for the synchronous collection loop; takes the same arguments.
+    '''
+    return asyncio.run(fetch_friend_timelines(*args, **kwargs))
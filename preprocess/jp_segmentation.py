@@ -0,0 +1,210 @@
+# coding: utf-8
+from multiprocessing import Pool
+import pandas as pd
+import itertools
+import hashlib
+import sqlite3
+import time
+import sys
+import os
+import re
+
+from tinysegmenter import TinySegmenter
+from term_merger import TermMerger, load_terms
+
+
+# segmenter and term merger of a worker process, built once by _init_worker
+_segmenter = None
+_merger = None
+
+
+class SegmentationCache(object):
+    '''
+    Persistent SQLite cache of TinySegmenter output, keyed by the hash of the message text.
+
+    Input:
+        path: SQLite database file
+    '''
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(str(path))
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS segmented (key BLOB PRIMARY KEY, text TEXT) WITHOUT ROWID')
+        self._db.commit()
+
+    @staticmethod
+    def key(message):
+        return hashlib.blake2b(message.encode('utf-8'), digest_size=16).digest()
+
+    def lookup(self, keys):
+        '''
+        Input:
+            keys: list of keys
+        Output:
+            dictionary of key: segmented text for the keys in the cache
+        '''
+        found = {}
+        for b in range(0, len(keys), 900):
+            batch = keys[b:b + 900]
+            query = 'SELECT key, text FROM segmented WHERE key IN (%s)' % ','.join('?' * len(batch))
+            found.update(self._db.execute(query, batch))
+        return found
+
+    def store(self, keys, texts):
+        self._db.executemany('INSERT OR IGNORE INTO segmented VALUES (?, ?)', zip(keys, texts))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def segment(message, segmenter):
+    '''
+    Remove whitespace from a message and split it into Japanese 'words' separated by spaces.
+    '''
+    return ' '.join(segmenter.tokenize(re.sub(r'\s+', '', message)))
+
+
+def finish_line(segmented, merger):
+    '''
+    Recognize the dictionary terms of a segmented message and collapse repeated spaces.
+    '''
+    return re.sub(r" +", " ", merger.merge(segmented))
+
+
+def _init_worker(termsList):
+    global _segmenter, _merger
+    _segmenter = TinySegmenter()
+    _merger = TermMerger(termsList)
+
+
+def _process_chunk(chunk):
+    # chunk: list of (message, segmented text from the cache or None)
+    out = []
+    for message, segmented in chunk:
+        if segmented is None:
+            segmented = segment(message, _segmenter)
+        out.append((segmented, finish_line(segmented, _merger)))
+    return out
+
+
+class JPSegmenter(object):
+    '''
+    Segmentation stage: segments blocks of Japanese messages with TinySegmenter and merges the segmented
+    dictionary terms, in chunks across a pool of workers that each build one segmenter, keeping input order.
+
+    Input:
+        sentistrength_dictionary_path: file path to the folder of the Japanese SentiStrength dictionary files
+        workers: number of worker processes (default 1: segment in this process)
+        chunksize: number of messages per task (default 1000)
+        cache_path: SQLite cache of segmented messages keyed by message hash (default None)
+    '''
+
+    def __init__(self, sentistrength_dictionary_path, workers=1, chunksize=1000, cache_path=None):
+        termsList = load_terms(sentistrength_dictionary_path)
+        self.workers = workers
+        self.chunksize = chunksize
+        self.cache = SegmentationCache(cache_path) if cache_path is not None else None
+        self.lines = 0
+        self.hits = 0
+        if workers > 1:
+            self._pool = Pool(workers, initializer=_init_worker, initargs=(termsList,))
+        else:
+            self._pool = None
+            _init_worker(termsList)
+
+    @property
+    def block_size(self):
+        # one block keeps every worker busy with a few chunks
+        return self.chunksize * max(self.workers, 1) * 4
+
+    def process(self, block):
+        '''
+        Input:
+            block: list of messages
+        Output:
+            list of segmented lines (without newline), in the order of block
+        '''
+        block = [m if isinstance(m, str) else str(m) for m in block]
+        if self.cache is not None:
+            keys = [SegmentationCache.key(m) for m in block]
+            found = self.cache.lookup(list(set(keys)))
+            cached = [found.get(k) for k in keys]
+        else:
+            cached = [None] * len(block)
+
+        items = list(zip(block, cached))
+        chunks = [items[i:i + self.chunksize] for i in range(0, len(items), self.chunksize)]
+        if self._pool is not None:
+            results = list(itertools.chain.from_iterable(self._pool.imap(_process_chunk, chunks)))
+        else:
+            results = list(itertools.chain.from_iterable(map(_process_chunk, chunks)))
+
+        if self.cache is not None:
+            new = dict((k, s) for k, c, (s, _) in zip(keys, cached, results) if c is None)
+            self.cache.store(list(new), list(new.values()))
+            self.hits += sum(c is not None for c in cached)
+        self.lines += len(block)
+        return [line for _, line in results]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def segment_messages(messages, output_path, sentistrength_dictionary_path, workers=1, chunksize=1000,
+                     cache_path=None, verbose=True):
+    '''
+    Segment Japanese messages with TinySegmenter, merge the segmented dictionary terms, and write one line
+    per message in input order (see JPSegmenter). The output is written to a temporary file that replaces
+    output_path only once complete, so a rerun overwrites it instead of appending to it.
+
+    Input:
+        messages: iterable of message strings
+        output_path: file to which segmented lines are saved (e.g. [output folder]/output_messages.txt)
+        sentistrength_dictionary_path: file path to the folder of the Japanese SentiStrength dictionary files
+        workers: number of worker processes (default 1: segment in this process)
+        chunksize: number of messages per task (default 1000)
+        cache_path: SQLite cache of segmented messages keyed by message hash (default None)
+        verbose: print progress or not (default True)
+    Output:
+        None
+    '''
+    start_time = time.time()
+    tmp_path = output_path + '.tmp%d' % os.getpid()
+    try:
+        with JPSegmenter(sentistrength_dictionary_path, workers, chunksize, cache_path) as segmenter, \
+                open(tmp_path, 'w', encoding='utf-8') as fw:
+            messages = iter(messages)
+            while True:
+                block = list(itertools.islice(messages, segmenter.block_size))
+                if not block:
+                    break
+                fw.writelines(line + '\n' for line in segmenter.process(block))
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if verbose:
+        print("Segmented %d messages in %.1fs with %d worker(s)%s" % (
+            segmenter.lines, time.time() - start_time, workers,
+            ", %.1f%% from the segmentation cache" % (100.0 * segmenter.hits / max(segmenter.lines, 1))
+            if cache_path is not None else ""))
+
+
+if __name__ == '__main__':
+    # python jp_segmentation.py [raw tweets .csv] [output file] [dictionary folder/] [workers] [cache .db]
+    dfG = pd.read_csv(sys.argv[1], encoding='utf8', usecols=['message'])
+    segment_messages(dfG['message'], sys.argv[2], sys.argv[3],
+                     workers=int(sys.argv[4]) if len(sys.argv) > 4 else 1,
+                     cache_path=sys.argv[5] if len(sys.argv) > 5 else None)
@@ -0,0 +1,244 @@
+# coding: utf-8
+import numpy as np
+import pandas as pd
+import io
+import os
+import re
+import sys
+
+from process_sentistrength_results import categorize_affect, read_sentistrength_output
+
+
+# dictionary files of the SentiStrength dictionary folder (older English versions name the lookup table EmotionLookupTable.txt)
+LOOKUP_FILES = ['SentimentLookupTable.txt', 'EmotionLookupTable.txt']
+BOOSTER_FILE = 'BoosterWordList.txt'
+NEGATING_FILE = 'NegatingWordList.txt'
+QUESTION_FILE = 'QuestionWords.txt'
+
+# word windows matching the command line options of each SentiStrength version (EN_OPTIONS, JP_OPTIONS):
+# negate_before / negate_after: words allowed between a negating word and the sentiment word after / before it
+#     (None: negating words on that side are ignored)
+# booster_gap: words allowed between a booster word and the sentiment word after it
+LANGUAGE_SETTINGS = {
+    'EN': {'negate_before': 0, 'negate_after': None, 'booster_gap': 0},
+    'JP': {'negate_before': None, 'negate_after': 1, 'booster_gap': 1},
+}
+
+# a negated positive word becomes negative with this share of its strength; a negated negative word becomes neutral
+NEGATED_STRENGTH = 0.5
+
+EN_WORD_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+
+def read_word_list(path, with_scores=True):
+    '''
+    Read a SentiStrength dictionary file: one term per line, followed by a tab and its score.
+    Lines without a score (comments, blank lines) are skipped when with_scores is True.
+
+    Input:
+        path: dictionary file
+        with_scores: read the score after the term (True) or only the term (False)
+    Output:
+        dictionary of term: score (or list of terms)
+    '''
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # the English dictionaries are Windows-1252
+        text = raw.decode('cp1252', 'replace')
+
+    terms = {} if with_scores else []
+    for line in text.splitlines():
+        fields = line.split('\t')
+        term = fields[0].strip().lower()
+        if not term:
+            continue
+        if not with_scores:
+            terms.append(term)
+            continue
+        try:
+            terms[term] = int(fields[1].strip())
+        except (IndexError, ValueError):
+            continue
+    return terms
+
+
+class WordTable(object):
+    '''
+    Lookup of dictionary terms: a hash table of exact terms and a trie of the terms ending with the "*" wildcard.
+    A word matches its exact term if there is one, otherwise the longest wildcard term it starts with.
+
+    Input:
+        terms: dictionary of term: value
+    '''
+
+    def __init__(self, terms):
+        self.exact = {}
+        self.trie = {}
+        for term, value in terms.items():
+            if term.endswith('*'):
+                node = self.trie
+                for c in term.rstrip('*'):
+                    node = node.setdefault(c, {})
+                node[None] = value
+            else:
+                self.exact[term] = value
+
+    def get(self, word, default=None):
+        value = self.exact.get(word)
+        if value is not None:
+            return value
+        value = default
+        node = self.trie
+        for c in word:
+            node = node.get(c)
+            if node is None:
+                break
+            if None in node:
+                value = node[None]
+        return value
+
+
+class LexiconScorer(object):
+    '''
+    In-process approximation of SentiStrength from the same dictionary folder: the strongest positive and
+    negative term of a message, with booster words strengthening the term after them, negating words
+    flipping positive terms and neutralizing negative terms, and negative terms ignored in questions.
+    SentiStrength's other rules (emoticons, repeated letters, exclamation marks, idioms) are not applied;
+    compare_with_sentistrength reports where the two differ.
+
+    Input:
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files
+        language: "EN" (words split on punctuation) or "JP" (already segmented, words split on spaces)
+    '''
+
+    backend = 'lexicon'
+
+    def __init__(self, sentistrength_dictionary_path, language='EN'):
+        self.language = language
+        self.settings = LANGUAGE_SETTINGS[language]
+
+        lookup = [os.path.join(sentistrength_dictionary_path, f) for f in LOOKUP_FILES
+                  if os.path.isfile(os.path.join(sentistrength_dictionary_path, f))]
+        if not lookup:
+            raise IOError("No %s in %s" % (' or '.join(LOOKUP_FILES), sentistrength_dictionary_path))
+        self.sentiment = WordTable(read_word_list(lookup[0]))
+        self.boosters = WordTable(self._optional(sentistrength_dictionary_path, BOOSTER_FILE, True, {}))
+        self.negating = WordTable(dict((w, True) for w in self._optional(sentistrength_dictionary_path, NEGATING_FILE, False, [])))
+        self.questions = set(self._optional(sentistrength_dictionary_path, QUESTION_FILE, False, []))
+
+    @staticmethod
+    def _optional(folder, name, with_scores, default):
+        path = os.path.join(folder, name)
+        return read_word_list(path, with_scores) if os.path.isfile(path) else default
+
+    def tokenize(self, message):
+        message = message.lower()
+        if self.language == 'EN':
+            return EN_WORD_RE.findall(message)
+        return message.split()
+
+    def score_message(self, message):
+        '''
+        Input:
+            message: message string
+        Output:
+            (pos, neg): positive (1 to 5) and negative (-1 to -5) score
+        '''
+        words = self.tokenize(message)
+        settings = self.settings
+        negating = [self.negating.get(w, False) for w in words]
+        question = '?' in message and any(w in self.questions for w in words)
+
+        pos, neg = 1, -1
+        for i, word in enumerate(words):
+            strength = self.sentiment.get(word)
+            if not strength:
+                continue
+
+            # booster word before the term
+            for j in range(max(0, i - settings['booster_gap'] - 1), i):
+                boost = self.boosters.get(words[j])
+                if boost:
+                    strength += boost if strength > 0 else -boost
+                    break
+
+            # negating word before or after the term
+            negated = False
+            if settings['negate_before'] is not None:
+                negated = any(negating[max(0, i - settings['negate_before'] - 1):i])
+            if not negated and settings['negate_after'] is not None:
+                negated = any(negating[i + 1:i + settings['negate_after'] + 2])
+            if negated:
+                strength = -int(round(strength * NEGATED_STRENGTH)) if strength > 0 else 0
+
+            if strength > 0:
+                pos = max(pos, min(strength, 5))
+            elif strength < 0 and not question:
+                neg = min(neg, max(strength, -5))
+        return pos, neg
+
+    def score(self, messages):
+        '''
+        Score messages, like SentiStrengthPool.score.
+
+        Input:
+            messages: iterable of message strings
+        Output:
+            pos: int8 array of positive scores (1 to 5), in the order of messages
+            neg: int8 array of negative scores (-1 to -5), in the order of messages
+        '''
+        scores = [self.score_message(m if isinstance(m, str) else str(m)) for m in messages]
+        scores = np.array(scores, dtype=np.int8).reshape(-1, 2)
+        return scores[:, 0], scores[:, 1]
+
+
+def compare_with_sentistrength(scorer, file_to_classify, sentistrength_output_path, sample_size=10000, seed=0, examples=20):
+    '''
+    Agreement of a scorer with the output of a SentiStrength run on a random sample of lines.
+
+    Input:
+        scorer: LexiconScorer
+        file_to_classify: file with one text per line that SentiStrength scored
+        sentistrength_output_path: the SentiStrength output of that file ([file_to_classify]_out.txt)
+        sample_size: number of lines compared (default 10000)
+        seed: random seed of the sample (default 0)
+        examples: number of disagreeing lines printed (default 20)
+    Output:
+        dataframe of the sampled lines with both scores
+    '''
+    java = read_sentistrength_output(sentistrength_output_path)
+    with io.open(file_to_classify, mode='r', encoding='utf-8', errors='replace', newline='\n') as f:
+        lines = [l.rstrip('\r\n') for l in f]
+    if len(lines) != len(java):
+        raise ValueError("%s has %d lines but %s has %d scores" % (file_to_classify, len(lines), sentistrength_output_path, len(java)))
+
+    rows = np.sort(np.random.RandomState(seed).choice(len(lines), size=min(sample_size, len(lines)), replace=False))
+    df = pd.DataFrame({'text': [lines[i] for i in rows],
+                       'java_pos': java['pos'].values[rows], 'java_neg': java['neg'].values[rows]}, index=rows)
+    df['pos'], df['neg'] = scorer.score(df['text'])
+
+    print("%d of %d lines compared" % (len(df), len(lines)))
+    print("positive score agrees on %.1f%%, negative on %.1f%%, both on %.1f%%" % (
+        100 * (df['pos'] == df['java_pos']).mean(), 100 * (df['neg'] == df['java_neg']).mean(),
+        100 * ((df['pos'] == df['java_pos']) & (df['neg'] == df['java_neg'])).mean()))
+    java_affect = categorize_affect(df['java_pos'].values, df['java_neg'].values)
+    affect = categorize_affect(df['pos'].values, df['neg'].values)
+    print("category agreement: " + ', '.join('%s %.1f%%' % (a, 100 * (affect[a] == java_affect[a]).mean()) for a in affect))
+    print("positive scores (rows: SentiStrength, columns: lexicon):")
+    print(pd.crosstab(df['java_pos'], df['pos']))
+    print("negative scores (rows: SentiStrength, columns: lexicon):")
+    print(pd.crosstab(df['java_neg'], df['neg']))
+
+    differ = df[(df['pos'] != df['java_pos']) | (df['neg'] != df['java_neg'])]
+    if len(differ):
+        print("examples of disagreement:")
+        print(differ.head(examples).to_string())
+    return df
+
+
+if __name__ == '__main__':
+    # python lexicon_scorer.py [dictionary folder/] [EN or JP] [output_messages.txt] [output_messages_out.txt]
+    compare_with_sentistrength(LexiconScorer(sys.argv[1], sys.argv[2]), sys.argv[3], sys.argv[4])
@@ -0,0 +1,147 @@
+from aiohttp import web
+import argparse
+import asyncio
+import datetime
+import random
+import time
+
+
+# mean seconds between the statuses of quiet, regular and active synthetic users
+STATUS_INTERVALS = (6 * 3600, 3600, 300)
+
+
+class MockTwitterAPI(object):
+    '''
+    Local stand-in for the endpoints the collection uses (oauth2/token, application/rate_limit_status and
+    statuses/user_timeline), so the collectors can be run without API keys or rate-limit waits: point their base_url
+    at the server. Every user has a deterministic timeline of statuses, newest first; user_timeline supports count,
+    since_id and max_id, answers with x-rate-limit headers, and answers 429 once limit requests were made in the
+    current window.
+
+    Input:
+        limit: user_timeline requests per window (default 1500)
+        window: window length in seconds (default 900)
+        statuses_per_user: number of statuses of every timeline (default 1000)
+        inaccessible: user ids answered with 401 (protected accounts) (default none)
+        error_rate: share of requests answered with 503 (default 0)
+        latency: seconds before every answer (default 0)
+        retry_after: answer 429 with a Retry-After header of this many seconds instead of the x-rate-limit
+                     headers, as a proxy in front of the API does (default None)
+        seed: seed of the synthetic statuses and errors (default 0)
+    '''
+
+    def __init__(self, limit=1500, window=900, statuses_per_user=1000, inaccessible=(), error_rate=0.0, latency=0.0,
+                 retry_after=None, seed=0):
+        self.limit = limit
+        self.window = window
+        self.statuses_per_user = statuses_per_user
+        self.inaccessible = set(str(u) for u in inaccessible)
+        self.error_rate = error_rate
+        self.latency = latency
+        self.retry_after = retry_after
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.now = int(time.time())
+        self.window_start = time.time()
+        self.used = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/oauth2/token', self.token)
+        app.router.add_get('/1.1/application/rate_limit_status.json', self.rate_limit_status)
+        app.router.add_get('/1.1/statuses/user_timeline.json', self.user_timeline)
+        return app
+
+    def _window(self):
+        if time.time() - self.window_start >= self.window:
+            self.window_start = time.time()
+            self.used = 0
+        return {'limit': self.limit, 'remaining': max(self.limit - self.used, 0),
+                'reset': int(self.window_start + self.window) + 1}
+
+    def _headers(self):
+        window = self._window()
+        return {'x-rate-limit-limit': str(window['limit']), 'x-rate-limit-remaining': str(window['remaining']),
+                'x-rate-limit-reset': str(window['reset'])}
+
+    async def token(self, request):
+        return web.json_response({'token_type': 'bearer', 'access_token': 'mock-token'})
+
+    async def rate_limit_status(self, request):
+        return web.json_response({'resources': {'statuses': {'/statuses/user_timeline': self._window()}}})
+
+    def timeline(self, user_id):
+        '''
+        Synthetic timeline of a user: list of status dictionaries, newest first.
+        '''
+        rng = random.Random('%s-%s' % (self.seed, user_id))
+        interval = rng.choice(STATUS_INTERVALS)
+        statuses = []
+        created = self.now - rng.randint(0, interval)
+        for n in range(self.statuses_per_user):
+            status_id = int(user_id) * 100000 + self.statuses_per_user - n
+            statuses.append({
+                'id': status_id, 'id_str': str(status_id),
+                'created_at': datetime.datetime.fromtimestamp(created, datetime.timezone.utc).strftime('%a %b %d %H:%M:%S +0000 %Y'),
+                'text': 'status %d of user %s' % (self.statuses_per_user - n, user_id),
+                'lang': rng.choice(['en', 'en', 'en', 'ja']),
+                'user': {'id': int(user_id), 'id_str': str(user_id)},
+            })
+            created -= rng.randint(1, 2 * interval)
+        return statuses
+
+    async def user_timeline(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests += 1
+        window = self._window()
+        if window['remaining'] <= 0:
+            self.rate_limited += 1
+            if self.retry_after is not None:
+                headers = {'Retry-After': str(self.retry_after)}
+            else:
+                headers = self._headers()
+            return web.json_response({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}, status=429,
+                                     headers=headers)
+        self.used += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({'errors': [{'code': 130, 'message': 'Over capacity'}]}, status=503,
+                                     headers=self._headers())
+
+        query = request.query
+        user_id = query.get('user_id')
+        if user_id is None or not user_id.isdigit():
+            return web.json_response({'errors': [{'code': 50, 'message': 'User not found.'}]}, status=404,
+                                     headers=self._headers())
+        if user_id in self.inaccessible:
+            return web.json_response({'request': request.path, 'error': 'Not authorized.'}, status=401,
+                                     headers=self._headers())
+
+        statuses = self.timeline(user_id)
+        if 'max_id' in query:
+            statuses = [s for s in statuses if s['id'] <= int(query['max_id'])]
+        if 'since_id' in query:
+            statuses = [s for s in statuses if s['id'] > int(query['since_id'])]
+        statuses = statuses[:min(int(query.get('count', 20)), 200)]
+        if query.get('trim_user') not in ('true', '1', 't'):
+            statuses = [dict(s, user={'id': int(user_id), 'id_str': user_id, 'screen_name': 'user%s' % user_id})
+                        for s in statuses]
+        return web.json_response(statuses, headers=self._headers())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a mock of the Twitter API endpoints used by the collection.")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--limit', type=int, default=1500)
+    parser.add_argument('--window', type=int, default=900)
+    parser.add_argument('--statuses-per-user', type=int, default=1000)
+    parser.add_argument('--inaccessible', type=int, nargs='*', default=[])
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int)
+    args = parser.parse_args()
+    api = MockTwitterAPI(args.limit, args.window, args.statuses_per_user, args.inaccessible, args.error_rate, args.latency,
+                         args.retry_after)
+    web.run_app(api.app(), port=args.port)
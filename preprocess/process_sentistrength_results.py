@@ -3,79 +3,108 @@ import pandas as pd
 import csv
 import sys
 
+from tweet_tables import read_raw_tweets
+from compressed_io import open_file
 
-def process_sentistrength_results(input_path, raw_file_path, output_path, tweet_type):    
+
+def read_sentistrength_output(input_path, chunksize=None):
+    '''
+    Read the positive and negative scores from a SentiStrength output file with the C csv reader.
+    The first line is a header; every other line starts with "pos<TAB>neg<TAB>", and the text after them is skipped.
+
+    Input:
+        input_path: file path containing SentiStrength output (REQUIRES .txt)
+        chunksize: if given, return an iterator of dataframes of this many rows (default None)
+    Output:
+        dataframe with int8 columns pos and neg (or iterator of dataframes when chunksize is given)
+    '''
+    return pd.read_csv(input_path, sep='\t', header=None, skiprows=1, usecols=[0, 1], names=['pos', 'neg'],
+                       dtype=np.int8, quoting=csv.QUOTE_NONE, chunksize=chunksize)
+
+
+def categorize_affect(pos, neg):
+    '''
+    Categorize SentiStrength scores into HAP, LAP, HAN, LAN, NEU flags with array comparisons.
+    A tweet scored (1, -1) is NEU only; otherwise positive 2 is LAP, 3 and above HAP,
+    negative -2 is LAN, and -3 and below HAN.
+
+    Input:
+        pos: array of positive scores (1 to 5)
+        neg: array of negative scores (-1 to -5)
+    Output:
+        dictionary of uint8 arrays with keys HAP, LAP, HAN, LAN, NEU
+    '''
+    pos = np.asarray(pos)
+    neg = np.asarray(neg)
+    neutral = (pos == 1) & (neg == -1)
+    affect = ~neutral
+    return {
+        'HAP': (affect & (pos >= 3)).astype(np.uint8),
+        'LAP': (affect & (pos > 1) & (pos < 3)).astype(np.uint8),
+        'HAN': (affect & (neg <= -3)).astype(np.uint8),
+        'LAN': (affect & (neg < -1) & (neg > -3)).astype(np.uint8),
+        'NEU': neutral.astype(np.uint8),
+    }
+
+
+def process_sentistrength_results(input_path, raw_file_path, output_path, tweet_type, chunksize=500000,
+                                  compression_level=None):
     '''
     Process SentiStrength results into five affective categories (HAP, LAP, HAN, LAN, NEU).
-    Append the processed results to the raw data file. 
-    
+    Append the processed results to the raw data file.
+    Both files are read in chunks of the same number of rows and joined row by row,
+    so only one chunk of each is in memory at a time.
+    Inputs and output may be .gz or .zst compressed; they are (de)compressed while streaming.
+
     Input:
         sentistrength_output_path: file path containing SentiStrength output (REQUIRES .txt)
         raw_file_path: file path containing raw data file (REQUIRES .csv)
-        output_path: file path to which results are saved (REQUIRES .csv) 
+        output_path: file path to which results are saved (REQUIRES .csv, or .csv.gz / .csv.zst to compress it)
         tweet_type: "user" or "friend"
+        chunksize: number of rows to process at a time (default 500000)
+        compression_level: compression level of a compressed output (default: see compressed_io)
     Output:
         None
-    ''' 
-
-    # Open raw data file
-    dfG = pd.read_csv(raw_file_path)
-
-
-    # Store SentiStrength output
-    posList = []
-    negList = []
-
-    with open(input_path,'r') as f:
-        f.readline()
-        for line in f:
-            posList.append(int(line[0:1]))
-            negList.append(int(line[2:4]))
-    f.close()
-
-    numStatuses = len(posList)
-
-
-    # Categorize into HAP, LAP, HAN, LAN, NEU categories
-    HAPList = [0]*numStatuses
-    LAPList = [0]*numStatuses
-    HANList = [0]*numStatuses
-    LANList = [0]*numStatuses
-    NEUList = [0]*numStatuses
-    for i in range(0,numStatuses):
-        if posList[i] == 1 and negList[i] == -1:
-            NEUList[i] = 1
-        else:
-            if posList[i] > 1 and posList[i] < 3:
-                LAPList[i] = 1
-            if posList[i] >= 3:
-                HAPList[i] = 1
-            if negList[i] < -1 and negList[i] > -3:
-                LANList[i] = 1
-            if negList[i] <= -3:
-                HANList[i] = 1 
-
-    dfGNew = dfG.copy()
-    dfGNew['pos'] = posList
-    dfGNew['neg'] = negList
-    dfGNew['HAP'] = HAPList
-    dfGNew['LAP'] = LAPList
-    dfGNew['HAN'] = HANList
-    dfGNew['LAN'] = LANList
-    dfGNew['NEU'] = NEUList
-
-
-
-    # Create new dataframe with the necessary informatioon
+    '''
+
+    # Columns of the new dataframe with the necessary information
     if tweet_type == 'friend':
-        dfGNewC = dfGNew[['friendid', 'userid', 'updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']]
+        columns = ['friendid', 'userid', 'updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']
     else:
-        dfGNewC = dfGNew[['userid','updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']]
+        columns = ['userid','updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']
+
+    # Open raw data file (ids and times only, the message text is not needed) and SentiStrength output
+    raw_chunks = read_raw_tweets(raw_file_path, tweet_type, chunksize=chunksize)
+    score_chunks = read_sentistrength_output(input_path, chunksize=chunksize)
+
+    numStatuses = 0
+    with open_file(output_path, 'w', level=compression_level) as f:
+        for dfG in raw_chunks:
+            scores = next(score_chunks, None)
+            numScores = numStatuses + (0 if scores is None else len(scores))
+            if numScores != numStatuses + len(dfG):
+                raise ValueError("SentiStrength output %s does not line up with %s: %d scores for the first %d rows" % (
+                    input_path, raw_file_path, numScores, numStatuses + len(dfG)))
+
+            # Categorize into HAP, LAP, HAN, LAN, NEU categories
+            dfG['pos'] = scores['pos'].values
+            dfG['neg'] = scores['neg'].values
+            for category, flags in categorize_affect(dfG['pos'].values, dfG['neg'].values).items():
+                dfG[category] = flags
+
+            # Save dataframe
+            dfG[columns].to_csv(f, header=(numStatuses == 0))
+            numStatuses += len(dfG)
 
+        if numStatuses == 0:
+            pd.DataFrame(columns=columns).to_csv(f)
 
-    # Save dataframe
-    dfGNewC.to_csv(output_path)
+    extra = sum(len(scores) for scores in score_chunks)
+    if extra:
+        raise ValueError("SentiStrength output %s has %d more lines than the %d rows of %s" % (
+            input_path, extra, numStatuses, raw_file_path))
 
 
 if __name__ == '__main__':
-    process_sentistrength_results(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+    process_sentistrength_results(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4],
+                                  compression_level=int(sys.argv[5]) if len(sys.argv) > 5 else None)
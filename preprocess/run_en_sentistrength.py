@@ -1,56 +1,50 @@
 # coding: utf-8
-import numpy as np
-import pandas as pd
-import csv
-import emoji
-import re
-import subprocess
-import shlex
+import argparse
 import os.path
 import sys
 
-def run_en_sentistrength(input_file_path, output_folder_path, sentistrength_path, sentistrength_dictionary_path):
+from en_normalization import normalize_file
+from sentistrength_runner import EN_OPTIONS, run_sentistrength
+from sentistrength_pool import score_file
+from score_cache import ScoreCache, score_file_cached, scorer_version
+from lexicon_scorer import LexiconScorer
+
+
+def run_en_sentistrength(input_file_path, output_folder_path, sentistrength_path, sentistrength_dictionary_path,
+                         shards=1, workers=None, pool=None, cache_path=None):
     '''
     Uses English SentiStrength to tag texts for sentiment.
     Output file will be saved under [processed_path]0_out.txt.
-    If number of texts is larger, wait a little for program to complete (~1 minute for every 1 million lines)
+    Returns once SentiStrength has finished (~1 minute for every 1 million lines per shard).
 
     Input:
-        input_file_path: file path to the file with raw text (REQUIRES ending with '.csv')
+        input_file_path: file path to the file with raw text (REQUIRES ending with '.csv', optionally .gz / .zst compressed)
         output_folder_path: file path to folder where you want to save your processed text file (REQUIRES ending with '/')
-        sentistrength_path: file path to the Japanese SentiStrength program
+        sentistrength_path: file path to the Japanese SentiStrength program (not used by a LexiconScorer pool)
         sentistrength_dictionary_path: file path to the folder of the Japanese SentiStrength dictionary files
+        shards: number of line-aligned shards scored by separate SentiStrength processes (default 1)
+        workers: number of SentiStrength processes to run at once (default: one per shard)
+        pool: SentiStrengthPool or LexiconScorer to score with instead of starting SentiStrength on the file (default None)
+        cache_path: SQLite score cache; only texts missing from it are scored (default None)
     Output:
         None
     '''
 
-    ## Load tweets dataframe
-    dfG = pd.read_csv(input_file_path)
-
-
     ################ PROCESSING APPLICABLE TO EN SENTISTRENGTH ################################################
-    
-    # Process each tweet
-    dfMessages = dfG['message']
-    with open(output_folder_path + "output_messages.txt", 'w') as f:
-        for m in dfMessages:
-            if not isinstance(m,str):
-                m = str(m)
-            linewritelist = re.findall(u'(?:[\ud800-\udbff][\udc00-\udfff])|.', m.decode('utf-8','replace'))
-            linewrite = ''.join('\t'+c+'\t' if c in emoji.UNICODE_EMOJI else c for c in linewritelist)
-            linewrite = linewrite.replace('\n',' ').replace('\r',' ').replace('\t',' ')
-            linewrite.rstrip()
-            linewrite = linewrite+'\n'
-            f.write(linewrite.encode('utf-8'))
-    f.close()
+
+    # Put each tweet on one line, with emoji separated from the surrounding text
+    normalize_file(input_file_path, output_folder_path + "output_messages.txt")
 
 
     ######################## APPLY SENTISTRENGTH to each status ####################################
     ## Modified from: http://sentistrength.wlv.ac.uk/jkpop/ClassifyCommentSentiment.py
     FileToClassify = output_folder_path + "output_messages.txt"
 
+    # the lexicon backend scores in-process from the dictionary files, without the SentiStrength program
+    in_process = getattr(pool, 'backend', 'java') != 'java'
+
     #Test file locations and quit if anything not found
-    if not os.path.isfile(sentistrength_path):
+    if not in_process and not os.path.isfile(sentistrength_path):
         print("SentiStrength not found at: ", sentistrength_path)
         sys.exit()
     if not os.path.isdir(sentistrength_dictionary_path):
@@ -58,14 +52,38 @@ def run_en_sentistrength(input_file_path, output_folder_path, sentistrength_path
         sys.exit()
     if not os.path.isfile(FileToClassify):
         print("File to classify not found at: ", FileToClassify)
+        sys.exit()
 
-    print("Running SentiStrength on file " + FileToClassify + " with command:")
-    cmd = 'java -jar "' + sentistrength_path + '" sentidata "' + sentistrength_dictionary_path + '" input "' + FileToClassify + '" utf8'
-    print(cmd)
-    p = subprocess.Popen(shlex.split(cmd),stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    classifiedSentimentFile = os.path.splitext(FileToClassify)[0] + "_out.txt"
-    print("Finished! The results will be in:\n" + classifiedSentimentFile)
+    def score(path):
+        if pool is not None:
+            return score_file(pool, path)
+        return run_sentistrength(path, sentistrength_path, sentistrength_dictionary_path, EN_OPTIONS,
+                                 shards=shards, workers=workers)
+
+    if cache_path is not None:
+        version = scorer_version('EN', None if in_process else sentistrength_path, sentistrength_dictionary_path,
+                                 EN_OPTIONS, backend=getattr(pool, 'backend', 'java'))
+        with ScoreCache(cache_path, version) as cache:
+            score_file_cached(cache, FileToClassify, score)
+    else:
+        score(FileToClassify)
 
 
 if __name__ == '__main__':
-    run_en_sentistrength(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+    parser = argparse.ArgumentParser(description="Tag texts for sentiment with English SentiStrength.")
+    parser.add_argument('input_file_path')
+    parser.add_argument('output_folder_path')
+    parser.add_argument('sentistrength_path', help='SentiStrength program (not used by the lexicon backend)')
+    parser.add_argument('sentistrength_dictionary_path')
+    parser.add_argument('shards', type=int, nargs='?', default=1)
+    parser.add_argument('workers', type=int, nargs='?')
+    parser.add_argument('cache_path', nargs='?', help='SQLite score cache')
+    parser.add_argument('--backend', choices=['java', 'lexicon'], default='java',
+                        help='java runs SentiStrength; lexicon scores in-process from the dictionary files')
+    args = parser.parse_args()
+
+    pool = None
+    if args.backend == 'lexicon':
+        pool = LexiconScorer(args.sentistrength_dictionary_path, 'EN')
+    run_en_sentistrength(args.input_file_path, args.output_folder_path, args.sentistrength_path, args.sentistrength_dictionary_path,
+                         args.shards, args.workers, pool=pool, cache_path=args.cache_path)
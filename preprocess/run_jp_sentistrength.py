@@ -1,83 +1,48 @@
 # coding: utf-8
-import numpy as np
 import pandas as pd
-import csv
-import emoji
-import re
-from jNlp.jTokenize import jTokenize
-from tinysegmenter import *
-import io
-import subprocess
-import shlex
+import argparse
 import os.path
 import sys
 
-
-def processLine(linewrite, termsList):
-    '''
-    Remove all spaces within a segmented term in the input string.
-    Input:
-    	linewrite: input string
-        termsList: list of terms from dictionary files
-    Output:
-    	linewrite: processed string
-    '''
-    for term in termsList:
-        if linewrite.find(term) != -1:
-            newterm = term.replace(' ','')
-            linewrite = linewrite.replace(term, newterm)
-    return linewrite
+from sentistrength_runner import JP_OPTIONS, run_sentistrength
+from sentistrength_pool import score_file
+from score_cache import ScoreCache, score_file_cached, scorer_version
+from lexicon_scorer import LexiconScorer
+from jp_segmentation import segment_messages
 
 
-def run_jp_sentistrength(input_file_path, output_folder_path, sentistrength_path, sentistrength_dictionary_path):
+def run_jp_sentistrength(input_file_path, output_folder_path, sentistrength_path, sentistrength_dictionary_path,
+                         shards=1, workers=None, pool=None, cache_path=None,
+                         segment_workers=1, segment_cache_path=None):
     '''
     Uses Japanese SentiStrength to tag texts for sentiment.
     Output file will be saved under [processed_path]0_out.txt.
-    If number of texts is larger, wait a little for program to complete.
+    Returns once SentiStrength has finished.
 
     Input:
-        input_file_path: file path to the file with raw text (REQUIRES ending with '.csv')
+        input_file_path: file path to the file with raw text (REQUIRES ending with '.csv', optionally .gz / .zst compressed)
         output_folder_path: file path to folder where you want to save your processed text file (REQUIRES ending with '/')
-        sentistrength_path: file path to the Japanese SentiStrength program
+        sentistrength_path: file path to the Japanese SentiStrength program (not used by a LexiconScorer pool)
         sentistrength_dictionary_path: file path to the folder of the Japanese SentiStrength dictionary files
+        shards: number of line-aligned shards scored by separate SentiStrength processes (default 1)
+        workers: number of SentiStrength processes to run at once (default: one per shard)
+        pool: SentiStrengthPool or LexiconScorer to score with instead of starting SentiStrength on the file (default None)
+        cache_path: SQLite score cache; only texts missing from it are scored (default None)
+        segment_workers: number of processes segmenting the texts (default 1)
+        segment_cache_path: SQLite cache of segmented texts (default None)
     Output:
         None
     '''
 
     # Load tweets dataframe
-    dfG = pd.read_csv(input_file_path, encoding='utf8')
+    dfG = pd.read_csv(input_file_path, encoding='utf8', usecols=['message'])
 
 
     ################ PROCESSING APPLICABLE TO JP SENTISTRENGTH ################################################
-    # Add all segmented dictionary terms to a list
-    termsList = []
-    for filename in ['NegatingWordListSeg.txt', 'QuestionWordsSeg.txt', 'BoosterWordListSeg.txt', 
-                     'SentimentLookupTableSeg.txt', 'NegationExceptionListSeg.txt']:
-        with io.open(sentistrength_dictionary_path + "segmented/" + filename, mode='r', encoding='utf-8') as f:
-            for line in f:
-                line = line[0:line.find('\t')]
-                line = line.replace('\n','').replace('\r','')
-                termsList.append(line)
-            f.close()
-
-
-    # Process each tweet to segment the tweet into Japanese 'words', recognize and process the dictionary terms
+    # Segment each tweet into Japanese 'words', recognize and process the dictionary terms
     # And remove newlines and other unnecessary characters
-    i=0
-    with io.open(output_folder_path + "output_messages.txt" ,mode='a', encoding='utf-8') as fw:
-        for m in dfG['message']:
-            segmenter = TinySegmenter()
-            linewrite = re.sub(r'\s+', '', m)
-            linewrite.rstrip()
-            linewrite.replace('~',' ')
-            linewrite = ' '.join(segmenter.tokenize(linewrite))
-            linewrite = processLine(linewrite, termsList)
-            linewrite = re.sub(r" +", " ", linewrite)
-            linewrite = linewrite+'\n'
-            fw.write(linewrite)
-            i+=1
-    fw.close()
-
+    segment_messages(dfG['message'], output_folder_path + "output_messages.txt", sentistrength_dictionary_path,
+                     workers=segment_workers, cache_path=segment_cache_path)
 
 
     ######################## APPLY SENTISTRENGTH to each status ####################################
@@ -85,8 +50,11 @@ def run_jp_sentistrength(input_file_path, output_folder_path, sentistrength_path
 
     FileToClassify = output_folder_path + "output_messages.txt"
 
+    # the lexicon backend scores in-process from the dictionary files, without the SentiStrength program
+    in_process = getattr(pool, 'backend', 'java') != 'java'
+
     #Test file locations and quit if anything not found
-    if not os.path.isfile(sentistrength_path):
+    if not in_process and not os.path.isfile(sentistrength_path):
         print("SentiStrength not found at: ", sentistrength_path)
         sys.exit()
     if not os.path.isdir(sentistrength_dictionary_path):
@@ -94,17 +62,38 @@ def run_jp_sentistrength(input_file_path, output_folder_path, sentistrength_path
         sys.exit()
     if not os.path.isfile(FileToClassify):
         print("File to classify not found at: ", FileToClassify)
+        sys.exit()
 
-    print("Running SentiStrength on file " + FileToClassify + " with command:")
-    cmd = 'java -jar "' + sentistrength_path + '" sentidata "' + sentistrength_dictionary_path + '" input "' + FileToClassify + '" negatingWordsOccurAfterSentiment maxWordsAfterSentimentToNegate 1 negatingWordsDontOccurBeforeSentiment maxWordsAfterBoosters 1'
-    print(cmd)
-    p = subprocess.Popen(shlex.split(cmd),stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+    def score(path):
+        if pool is not None:
+            return score_file(pool, path)
+        return run_sentistrength(path, sentistrength_path, sentistrength_dictionary_path, JP_OPTIONS,
+                                 shards=shards, workers=workers)
 
-    #classifiedSentimentFile = "/Users/tiffanyhsu/projects/jpsentistrength/test_output.txt"
-    classifiedSentimentFile = os.path.splitext(FileToClassify)[0] + "_out.txt"
-    print("Finished! The results will be in:\n" + classifiedSentimentFile)
+    if cache_path is not None:
+        version = scorer_version('JP', None if in_process else sentistrength_path, sentistrength_dictionary_path,
+                                 JP_OPTIONS, backend=getattr(pool, 'backend', 'java'))
+        with ScoreCache(cache_path, version) as cache:
+            score_file_cached(cache, FileToClassify, score)
+    else:
+        score(FileToClassify)
 
 
 if __name__ == '__main__':
-    run_jp_sentistrength(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
-
+    parser = argparse.ArgumentParser(description="Tag texts for sentiment with Japanese SentiStrength.")
+    parser.add_argument('input_file_path')
+    parser.add_argument('output_folder_path')
+    parser.add_argument('sentistrength_path', help='SentiStrength program (not used by the lexicon backend)')
+    parser.add_argument('sentistrength_dictionary_path')
+    parser.add_argument('shards', type=int, nargs='?', default=1)
+    parser.add_argument('workers', type=int, nargs='?')
+    parser.add_argument('cache_path', nargs='?', help='SQLite score cache')
+    parser.add_argument('--backend', choices=['java', 'lexicon'], default='java',
+                        help='java runs SentiStrength; lexicon scores in-process from the dictionary files')
+    args = parser.parse_args()
+
+    pool = None
+    if args.backend == 'lexicon':
+        pool = LexiconScorer(args.sentistrength_dictionary_path, 'JP')
+    run_jp_sentistrength(args.input_file_path, args.output_folder_path, args.sentistrength_path, args.sentistrength_dictionary_path,
+                         args.shards, args.workers, pool=pool, cache_path=args.cache_path)
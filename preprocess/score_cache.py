@@ -0,0 +1,218 @@
+import numpy as np
+import itertools
+import hashlib
+import sqlite3
+import time
+import os
+
+from table_cache import content_hash
+from process_sentistrength_results import read_sentistrength_output
+from sentistrength_runner import output_path_of
+
+
+# number of keys per SQLite lookup (below the default limit of 999 parameters)
+LOOKUP_SIZE = 900
+
+
+def scorer_version(language, sentistrength_path, sentistrength_dictionary_path, options, backend='java'):
+    '''
+    Version tag of a SentiStrength setup: language, options, scoring backend, and the content hashes of
+    the program and of every dictionary file, so scores are never reused after any of them changes.
+
+    Input:
+        language: "EN" or "JP"
+        sentistrength_path: file path to the SentiStrength program (None for the lexicon backend)
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files
+        options: extra SentiStrength options (EN_OPTIONS or JP_OPTIONS)
+        backend: "java" (SentiStrength) or "lexicon" (LexiconScorer) (default "java")
+    Output:
+        version string
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    h.update(('%s|%s|%s|' % (language, ' '.join(options), backend)).encode('utf-8'))
+    if sentistrength_path is not None:
+        h.update(content_hash(sentistrength_path).encode('utf-8'))
+    for root, dirs, files in os.walk(sentistrength_dictionary_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            h.update(('|%s|%s' % (os.path.relpath(path, sentistrength_dictionary_path), content_hash(path))).encode('utf-8'))
+    return '%s-%s' % (language, h.hexdigest())
+
+
+class ScoreCache(object):
+    '''
+    Persistent SQLite cache of SentiStrength scores, keyed by the hash of the scorer version and the
+    normalized message text (a line of output_messages.txt).
+
+    Input:
+        path: SQLite database file
+        version: scorer version (see scorer_version)
+    '''
+
+    def __init__(self, path, version):
+        self.path = str(path)
+        self.version = version
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, pos INTEGER, neg INTEGER) WITHOUT ROWID')
+        self._db.commit()
+
+    def key(self, text):
+        return hashlib.blake2b(('%s\0%s' % (self.version, text)).encode('utf-8'), digest_size=16).digest()
+
+    def lookup(self, keys):
+        '''
+        Input:
+            keys: list of keys
+        Output:
+            dictionary of key: (pos, neg) for the keys in the cache
+        '''
+        found = {}
+        for b in range(0, len(keys), LOOKUP_SIZE):
+            batch = keys[b:b + LOOKUP_SIZE]
+            query = 'SELECT key, pos, neg FROM scores WHERE key IN (%s)' % ','.join('?' * len(batch))
+            for key, pos, neg in self._db.execute(query, batch):
+                found[key] = (pos, neg)
+        return found
+
+    def store(self, keys, pos, neg):
+        '''
+        Input:
+            keys: list of keys
+            pos: positive scores of the keys
+            neg: negative scores of the keys
+        '''
+        self._db.executemany('INSERT OR IGNORE INTO scores VALUES (?, ?, ?)',
+                             zip(keys, (int(p) for p in pos), (int(n) for n in neg)))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _lookup_lines(cache, lines, miss_keys, on_miss):
+    '''
+    Look up lines in the cache. Each distinct missing line gets the next index in miss_keys (key: index, shared
+    across calls) and is passed to on_miss once.
+
+    Output:
+        pos: int8 array of positive scores (0 for misses)
+        neg: int8 array of negative scores (0 for misses)
+        miss: index in miss_keys of every missing line, -1 for lines found in the cache
+    '''
+    keys = [cache.key(l) for l in lines]
+    found = cache.lookup(list(set(keys)))
+    pos = np.zeros(len(lines), dtype=np.int8)
+    neg = np.zeros(len(lines), dtype=np.int8)
+    miss = np.full(len(lines), -1, dtype=np.int64)
+    for i, (line, key) in enumerate(zip(lines, keys)):
+        if key in found:
+            pos[i], neg[i] = found[key]
+        else:
+            if key not in miss_keys:
+                miss_keys[key] = len(miss_keys)
+                on_miss(line)
+            miss[i] = miss_keys[key]
+    return pos, neg, miss
+
+
+def _store_misses(cache, miss_keys, miss_pos, miss_neg, pos, neg, miss):
+    '''
+    Add the scores of the distinct missing lines (in miss_keys order) to the cache and fill them in pos and neg.
+    '''
+    cache.store(list(miss_keys), miss_pos, miss_neg)
+    missed = miss >= 0
+    pos[missed] = miss_pos[miss[missed]]
+    neg[missed] = miss_neg[miss[missed]]
+
+
+def score_cached(cache, scorer, lines):
+    '''
+    Score lines with a scorer (SentiStrengthPool or LexiconScorer), sending only the distinct lines missing
+    from the cache to it, and add their scores to the cache.
+
+    Input:
+        cache: ScoreCache
+        scorer: object with score(messages) -> (pos, neg)
+        lines: list of normalized texts
+    Output:
+        pos: int8 array of positive scores
+        neg: int8 array of negative scores
+        hits: number of lines whose scores came from the cache
+    '''
+    miss_keys = {}
+    miss_lines = []
+    pos, neg, miss = _lookup_lines(cache, lines, miss_keys, miss_lines.append)
+    if miss_lines:
+        miss_pos, miss_neg = scorer.score(miss_lines)
+        _store_misses(cache, miss_keys, miss_pos, miss_neg, pos, neg, miss)
+    return pos, neg, int((miss < 0).sum())
+
+
+def score_file_cached(cache, file_to_classify, score, chunksize=100000, verbose=True):
+    '''
+    Score every line of a file, sending only the distinct lines missing from the cache to SentiStrength.
+    The misses are written to [file_to_classify]_misses.txt and scored with score(path); their scores are
+    added to the cache, and the full-order output is written in the format of a SentiStrength file run
+    ([file_to_classify]_out.txt).
+
+    Input:
+        cache: ScoreCache
+        file_to_classify: file with one text per line
+        score: function that scores a file of texts and returns the path of its SentiStrength output
+        chunksize: number of lines looked up at a time (default 100000)
+        verbose: print the hit rate or not (default True)
+    Output:
+        classifiedSentimentFile: file path of the results
+        hit_rate: share of lines whose scores came from the cache
+    '''
+    classifiedSentimentFile = output_path_of(file_to_classify)
+    missesFile = os.path.splitext(file_to_classify)[0] + '_misses.txt'
+    start_time = time.time()
+
+    # pass 1: look up every line; each distinct miss is written once
+    pos_chunks, neg_chunks, miss_chunks = [], [], []
+    miss_keys = {}
+    with open(file_to_classify, encoding='utf-8', errors='replace', newline='\n') as f, \
+            open(missesFile, 'w', encoding='utf-8') as fm:
+        while True:
+            lines = [l.rstrip('\r\n') for l in itertools.islice(f, chunksize)]
+            if not lines:
+                break
+            pos, neg, miss = _lookup_lines(cache, lines, miss_keys, lambda line: fm.write(line + '\n'))
+            pos_chunks.append(pos)
+            neg_chunks.append(neg)
+            miss_chunks.append(miss)
+
+    pos = np.concatenate(pos_chunks) if pos_chunks else np.zeros(0, dtype=np.int8)
+    neg = np.concatenate(neg_chunks) if neg_chunks else np.zeros(0, dtype=np.int8)
+    miss = np.concatenate(miss_chunks) if miss_chunks else np.zeros(0, dtype=np.int64)
+
+    # score the misses and add them to the cache
+    if miss_keys:
+        scores = read_sentistrength_output(score(missesFile))
+        if len(scores) != len(miss_keys):
+            raise RuntimeError("SentiStrength scored %d of the %d lines of %s" % (len(scores), len(miss_keys), missesFile))
+        _store_misses(cache, miss_keys, scores['pos'].values, scores['neg'].values, pos, neg, miss)
+        os.remove(output_path_of(missesFile))
+    os.remove(missesFile)
+
+    # pass 2: write the scores in the original order
+    with open(file_to_classify, encoding='utf-8', errors='replace', newline='\n') as f, \
+            open(classifiedSentimentFile, 'w', encoding='utf-8') as fw:
+        fw.write('Positive\tNegative\tText\n')
+        for p, n, line in zip(pos.tolist(), neg.tolist(), f):
+            fw.write('%d\t%d\t%s\n' % (p, n, line.rstrip('\r\n')))
+
+    hit_rate = float((miss < 0).sum()) / max(len(miss), 1)
+    if verbose:
+        print("Finished in %.1fs! %d lines, %.1f%% from the score cache, %d distinct lines sent to SentiStrength. The results are in:\n%s" % (
+            time.time() - start_time, len(miss), 100 * hit_rate, len(miss_keys), classifiedSentimentFile))
+    return classifiedSentimentFile, hit_rate
@@ -0,0 +1,169 @@
+import pandas as pd
+import argparse
+import time
+import os
+
+from tweet_tables import read_raw_tweets
+from process_sentistrength_results import categorize_affect
+from sentistrength_runner import EN_OPTIONS, JP_OPTIONS
+from compressed_io import compression_of, open_file
+from score_cache import ScoreCache, score_cached, scorer_version
+from sentistrength_pool import SentiStrengthPool
+from lexicon_scorer import LexiconScorer
+
+
+OPTIONS = {'EN': EN_OPTIONS, 'JP': JP_OPTIONS}
+
+
+def raw_chunks(raw_file_path, tweet_type, chunksize):
+    '''
+    Raw status rows (ids, updated_time and message), chunksize rows at a time.
+    '''
+    return read_raw_tweets(raw_file_path, tweet_type, chunksize=chunksize, messages=True)
+
+
+def prepared_chunks(chunks, prepare):
+    '''
+    Add the text SentiStrength scores (one line per message, see normalize_messages / JPSegmenter.process)
+    to each chunk as the "text" column.
+    '''
+    for dfG in chunks:
+        dfG['text'] = prepare(dfG['message'])
+        yield dfG
+
+
+def scored_chunks(chunks, scorer, cache=None):
+    '''
+    Add the pos and neg scores of each chunk's text, from the score cache where possible.
+    '''
+    for dfG in chunks:
+        lines = dfG['text'].tolist()
+        if cache is not None:
+            pos, neg, hits = score_cached(cache, scorer, lines)
+            dfG.attrs['hits'] = hits
+        else:
+            pos, neg = scorer.score(lines)
+        dfG['pos'] = pos
+        dfG['neg'] = neg
+        yield dfG
+
+
+def categorized_chunks(chunks):
+    '''
+    Add the HAP, LAP, HAN, LAN, NEU flags of each chunk's scores.
+    '''
+    for dfG in chunks:
+        for category, flags in categorize_affect(dfG['pos'].values, dfG['neg'].values).items():
+            dfG[category] = flags
+        yield dfG
+
+
+def score_raw_tweets(raw_file_path, output_path, tweet_type, language, scorer, sentistrength_dictionary_path=None,
+                     chunksize=100000, segment_workers=1, segment_cache_path=None, cache=None, compression_level=None,
+                     verbose=True):
+    '''
+    Score a raw tweets csv in one streaming pass: raw rows are read in chunks, normalized (EN) or segmented (JP),
+    scored, and categorized into affect flags, and only the scored table is written, in the format of
+    process_sentistrength_results. No output_messages.txt or SentiStrength output file is written, and
+    only one chunk is held in memory at a time. The table is written to a temporary file that replaces
+    output_path only once complete.
+
+    Input:
+        raw_file_path: file path containing raw data file (REQUIRES .csv, optionally .gz / .zst compressed)
+        output_path: file path to which results are saved (REQUIRES .csv, or .csv.gz / .csv.zst to compress it)
+        tweet_type: "user" or "friend"
+        language: "EN" or "JP"
+        scorer: SentiStrengthPool or LexiconScorer
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files (required for JP)
+        chunksize: number of rows processed at a time (default 100000)
+        segment_workers: number of processes segmenting JP texts (default 1)
+        segment_cache_path: SQLite cache of segmented JP texts (default None)
+        cache: ScoreCache, so only texts missing from it are scored (default None)
+        compression_level: compression level of a compressed output (default: see compressed_io)
+        verbose: print progress or not (default True)
+    Output:
+        None
+    '''
+    if tweet_type == 'friend':
+        columns = ['friendid', 'userid', 'updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']
+    else:
+        columns = ['userid','updated_time','pos','neg','HAP','LAP','HAN','LAN','NEU']
+
+    # each language's preprocessing needs its own packages (tinysegmenter or emoji), so only that one is imported
+    segmenter = None
+    if language == 'JP':
+        from jp_segmentation import JPSegmenter
+        segmenter = JPSegmenter(sentistrength_dictionary_path, workers=segment_workers, cache_path=segment_cache_path)
+        prepare = segmenter.process
+    else:
+        from en_normalization import normalize_messages
+        prepare = lambda messages: normalize_messages(messages).tolist()
+
+    start_time = time.time()
+    numStatuses = 0
+    hits = 0
+    tmp_path = output_path + '.tmp%d' % os.getpid()
+    try:
+        with open_file(tmp_path, 'w', compression=compression_of(output_path), level=compression_level) as f:
+            chunks = categorized_chunks(scored_chunks(prepared_chunks(
+                raw_chunks(raw_file_path, tweet_type, chunksize), prepare), scorer, cache))
+            for dfG in chunks:
+                dfG[columns].to_csv(f, header=(numStatuses == 0))
+                numStatuses += len(dfG)
+                hits += dfG.attrs.get('hits', 0)
+                if verbose:
+                    print("%d statuses scored (%.0f/s)" % (numStatuses, numStatuses / max(time.time() - start_time, 1e-9)))
+            if numStatuses == 0:
+                pd.DataFrame(columns=columns).to_csv(f)
+        os.replace(tmp_path, output_path)
+    finally:
+        if segmenter is not None:
+            segmenter.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if verbose:
+        print("Finished in %.1fs! %d statuses%s. The results are in:\n%s" % (
+            time.time() - start_time, numStatuses,
+            ", %.1f%% from the score cache" % (100.0 * hits / max(numStatuses, 1)) if cache is not None else "",
+            output_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score a raw tweets csv in one streaming pass.")
+    parser.add_argument('raw_file_path')
+    parser.add_argument('output_path')
+    parser.add_argument('tweet_type', choices=['user', 'friend'])
+    parser.add_argument('language', choices=sorted(OPTIONS))
+    parser.add_argument('sentistrength_dictionary_path')
+    parser.add_argument('--sentistrength-path', help='SentiStrength program (java backend)')
+    parser.add_argument('--backend', choices=['java', 'lexicon'], default='java')
+    parser.add_argument('--workers', type=int, default=2, help='SentiStrength processes (java backend)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--segment-workers', type=int, default=1)
+    parser.add_argument('--segment-cache', help='SQLite cache of segmented JP texts')
+    parser.add_argument('--cache', help='SQLite score cache')
+    parser.add_argument('--compression-level', type=int, help='level of a .gz / .zst output')
+    args = parser.parse_args()
+
+    if args.backend == 'java':
+        scorer = SentiStrengthPool(args.sentistrength_path, args.sentistrength_dictionary_path, OPTIONS[args.language],
+                                   workers=args.workers, batch_size=args.batch_size)
+    else:
+        scorer = LexiconScorer(args.sentistrength_dictionary_path, args.language)
+
+    cache = None
+    if args.cache:
+        cache = ScoreCache(args.cache, scorer_version(args.language, args.sentistrength_path, args.sentistrength_dictionary_path,
+                                                      OPTIONS[args.language], backend=scorer.backend))
+    try:
+        score_raw_tweets(args.raw_file_path, args.output_path, args.tweet_type, args.language, scorer,
+                         args.sentistrength_dictionary_path, chunksize=args.chunksize, segment_workers=args.segment_workers,
+                         segment_cache_path=args.segment_cache, cache=cache,
+                         compression_level=args.compression_level)
+    finally:
+        if cache is not None:
+            cache.close()
+        if hasattr(scorer, 'close'):
+            scorer.close()
@@ -0,0 +1,152 @@
+import threading
+import hashlib
+import sqlite3
+import math
+import time
+import sys
+
+
+class BloomFilter(object):
+    '''
+    Bit array answering "certainly not added" or "maybe added" for integer ids, in about 1.2 bytes per id
+    at a 1% error rate.
+
+    Input:
+        capacity: number of ids it is sized for
+        error_rate: share of ids not added that are answered "maybe added" at capacity (default 0.01)
+    '''
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(int(round(self.size / float(capacity) * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, userid):
+        # double hashing: position i is h1 + i * h2
+        digest = hashlib.blake2b(str(int(userid)).encode('ascii'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, userid):
+        for p in self._positions(userid):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, userid):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(userid))
+
+
+class SeenUserRegistry(object):
+    '''
+    Persistent SQLite registry of the users already sampled, replacing [country]_existing_users.txt: an indexed
+    table of user ids, shared by the collectors of both countries (WAL mode), to which a user is added durably as
+    soon as it is accepted. add is atomic, so two collectors never accept the same user.
+    With bloom_capacity, a BloomFilter of the registered ids answers most lookups of unseen users without a query;
+    it is brought up to date with the users other collectors added at most every sync_interval seconds, and
+    add still checks the table.
+
+    Input:
+        path: SQLite database file
+        bloom_capacity: number of users the Bloom filter is sized for (default None: no Bloom filter)
+        sync_interval: seconds between updates of the Bloom filter from the table (default 1)
+    '''
+
+    def __init__(self, path, bloom_capacity=None, sync_interval=1.0):
+        self.path = str(path)
+        self.sync_interval = sync_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS users (seq INTEGER PRIMARY KEY AUTOINCREMENT, userid INTEGER UNIQUE, '
+                   'country TEXT, added REAL)')
+        db.commit()
+
+        self.bloom = None
+        self._synced_seq = 0
+        self._synced = 0.0
+        if bloom_capacity is not None:
+            self.bloom = BloomFilter(max(bloom_capacity, self.count()))
+            self._sync()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=60)
+            db.execute('PRAGMA journal_mode=WAL')
+            # an accepted user survives a crash of the collector or of the machine
+            db.execute('PRAGMA synchronous=FULL')
+        return db
+
+    def _sync(self):
+        with self._lock:
+            rows = self._db().execute('SELECT seq, userid FROM users WHERE seq > ? ORDER BY seq', (self._synced_seq,))
+            for seq, userid in rows:
+                self.bloom.add(userid)
+                self._synced_seq = seq
+            self._synced = time.time()
+
+    def __contains__(self, userid):
+        if self.bloom is not None:
+            if time.time() - self._synced >= self.sync_interval:
+                self._sync()
+            if userid not in self.bloom:
+                return False
+        return self._db().execute('SELECT 1 FROM users WHERE userid = ?', (int(userid),)).fetchone() is not None
+
+    def add(self, userid, country=None):
+        '''
+        Register a user, committed before returning.
+
+        Output:
+            True if the user was added, False if it was already registered
+        '''
+        db = self._db()
+        added = db.execute('INSERT OR IGNORE INTO users (userid, country, added) VALUES (?, ?, ?)',
+                           (int(userid), country, time.time())).rowcount == 1
+        db.commit()
+        if added and self.bloom is not None:
+            with self._lock:
+                self.bloom.add(userid)
+        return added
+
+    def count(self, country=None):
+        if country is None:
+            return self._db().execute('SELECT count(*) FROM users').fetchone()[0]
+        return self._db().execute('SELECT count(*) FROM users WHERE country = ?', (country,)).fetchone()[0]
+
+    def import_text(self, path, country=None):
+        '''
+        Register the user ids of a text file with one id per line (e.g. [country]_existing_users.txt).
+
+        Output:
+            number of users added
+        '''
+        db = self._db()
+        with open(path) as f:
+            ids = [(int(line), country, time.time()) for line in f if line.strip()]
+        before = db.total_changes
+        db.executemany('INSERT OR IGNORE INTO users (userid, country, added) VALUES (?, ?, ?)', ids)
+        db.commit()
+        if self.bloom is not None:
+            self._sync()
+        return db.total_changes - before
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    # register the users of an existing users file
+    # python seen_users.py [registry .db] [country]_existing_users.txt [country]
+    with SeenUserRegistry(sys.argv[1]) as registry:
+        print("%d users added" % registry.import_text(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
@@ -0,0 +1,248 @@
+from concurrent.futures import Future
+import numpy as np
+import subprocess
+import itertools
+import threading
+import tempfile
+import queue
+import time
+
+from sentistrength_runner import EN_OPTIONS, output_path_of, sentistrength_command
+
+
+# SentiStrength scores of a text without sentiment
+NEUTRAL = (1, -1)
+
+
+class SentiStrengthPool(object):
+    '''
+    Pool of long-lived SentiStrength processes in stdin mode, so the JVM starts and the dictionaries
+    are loaded once per process instead of once per file.
+    Messages are split into batches that wait in a bounded queue; each process takes a batch, is fed
+    one message per line and answers one "pos neg" line per message.
+
+    Input:
+        sentistrength_path: file path to the SentiStrength program
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files
+        options: extra SentiStrength options (EN_OPTIONS or JP_OPTIONS)
+        workers: number of SentiStrength processes kept running (default 2)
+        batch_size: number of messages sent to a process at a time (default 1000)
+        queue_depth: number of batches that can wait for a process before score blocks (default 8)
+    '''
+
+    backend = 'java'
+
+    def __init__(self, sentistrength_path, sentistrength_dictionary_path, options=EN_OPTIONS,
+                 workers=2, batch_size=1000, queue_depth=8):
+        self.batch_size = batch_size
+        self.command = sentistrength_command(sentistrength_path, sentistrength_dictionary_path, None, options)
+        # stdin mode instead of "input [file]"
+        i = self.command.index('input')
+        self.command[i:i + 2] = ['stdin']
+
+        self._batches = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._batch_count = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._score_time = 0.0
+
+        self._processes = []
+        self._threads = []
+        for n in range(workers):
+            self._processes.append(self._spawn())
+            thread = threading.Thread(target=self._work, args=(n,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _spawn(self):
+        errors = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors,
+                                       encoding='utf-8', errors='replace', bufsize=1)
+        except Exception:
+            errors.close()
+            raise
+        return process, errors
+
+    @staticmethod
+    def _kill(process, errors, writer=None):
+        process.kill()
+        process.wait()
+        if writer is not None:
+            # the writer fails on the closed pipe
+            writer.join()
+        for stream in (process.stdin, process.stdout):
+            try:
+                stream.close()
+            except (BrokenPipeError, ValueError):
+                pass
+        errors.close()
+
+    def score(self, messages):
+        '''
+        Score messages with SentiStrength.
+        Newlines and tabs in a message are sent as spaces; blank messages are scored neutral (1, -1) without SentiStrength.
+
+        Input:
+            messages: iterable of message strings
+        Output:
+            pos: int8 array of positive scores (1 to 5), in the order of messages
+            neg: int8 array of negative scores (-1 to -5), in the order of messages
+        '''
+        start = time.time()
+        lines = [_one_line(m) for m in messages]
+        pos = np.full(len(lines), NEUTRAL[0], dtype=np.int8)
+        neg = np.full(len(lines), NEUTRAL[1], dtype=np.int8)
+        todo = np.array([bool(l.strip()) for l in lines], dtype=bool)
+        index = np.flatnonzero(todo)
+
+        pending = []
+        for b in range(0, len(index), self.batch_size):
+            batch_index = index[b:b + self.batch_size]
+            result = Future()
+            # blocks while queue_depth batches are waiting
+            self._batches.put(([lines[i] for i in batch_index], result, time.time()))
+            pending.append((batch_index, result))
+        for batch_index, result in pending:
+            pos[batch_index], neg[batch_index] = result.result()
+
+        with self._lock:
+            self._score_time += time.time() - start
+        return pos, neg
+
+    def _work(self, n):
+        while True:
+            item = self._batches.get()
+            if item is None:
+                return
+            lines, result, queued = item
+            writer = None
+            try:
+                if self._processes[n] is None:
+                    # the last process could not be replaced
+                    self._processes[n] = self._spawn()
+                process, errors = self._processes[n]
+                # write from a second thread, so a full stdout pipe cannot block both sides
+                writer = threading.Thread(target=_write_lines, args=(process.stdin, lines))
+                writer.start()
+                scores = np.empty((len(lines), 2), dtype=np.int8)
+                for i in range(len(lines)):
+                    answer = process.stdout.readline()
+                    if not answer:
+                        errors.seek(0)
+                        raise RuntimeError("SentiStrength exited with status %s:\n%s" % (
+                            process.poll(), errors.read()[-2000:].decode('utf-8', 'replace')))
+                    scores[i] = [int(s) for s in answer.split()[:2]]
+                writer.join()
+            except Exception as e:
+                # the process may still hold answers of this batch, which the next batch would read:
+                # replace it before taking the next batch
+                if self._processes[n] is not None:
+                    self._kill(*self._processes[n], writer=writer)
+                    self._processes[n] = None
+                try:
+                    self._processes[n] = self._spawn()
+                except Exception:
+                    pass
+                result.set_exception(e)
+                continue
+            latency = time.time() - queued
+            with self._lock:
+                self._messages += len(lines)
+                self._batch_count += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+            result.set_result((scores[:, 0], scores[:, 1]))
+
+    def stats(self):
+        '''
+        Counters since the pool started.
+
+        Output:
+            dictionary with messages and batches scored by SentiStrength, mean and max batch latency in seconds
+            (from queueing to answer), and throughput in messages per second of score calls
+        '''
+        with self._lock:
+            return {
+                'messages': self._messages,
+                'batches': self._batch_count,
+                'latency_mean': self._latency_total / max(self._batch_count, 1),
+                'latency_max': self._latency_max,
+                'throughput': self._messages / self._score_time if self._score_time else 0.0,
+            }
+
+    def close(self):
+        '''
+        Stop the worker threads and SentiStrength processes.
+        '''
+        for _ in self._threads:
+            self._batches.put(None)
+        for thread in self._threads:
+            thread.join()
+        for item in self._processes:
+            if item is None:
+                continue
+            process, errors = item
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+            errors.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def score_file(pool, file_to_classify, chunksize=100000, verbose=True):
+    '''
+    Score every line of a file with a SentiStrengthPool (or a LexiconScorer) and write the results in the format
+    of a SentiStrength file run ([file_to_classify]_out.txt: a header, then "pos<TAB>neg<TAB>text" per line).
+
+    Input:
+        pool: SentiStrengthPool or LexiconScorer
+        file_to_classify: file with one text per line
+        chunksize: number of lines passed to pool.score at a time (default 100000)
+        verbose: print progress or not (default True)
+    Output:
+        classifiedSentimentFile: file path of the results
+    '''
+    classifiedSentimentFile = output_path_of(file_to_classify)
+    start_time = time.time()
+    with open(file_to_classify, encoding='utf-8', errors='replace', newline='\n') as f, \
+            open(classifiedSentimentFile, 'w', encoding='utf-8') as fw:
+        fw.write('Positive\tNegative\tText\n')
+        while True:
+            lines = [l.rstrip('\r\n') for l in itertools.islice(f, chunksize)]
+            if not lines:
+                break
+            pos, neg = pool.score(lines)
+            fw.writelines('%d\t%d\t%s\n' % row for row in zip(pos.tolist(), neg.tolist(), lines))
+    if verbose and hasattr(pool, 'stats'):
+        stats = pool.stats()
+        print("Finished in %.1fs (%.0f messages/s, mean batch latency %.3fs)! The results are in:\n%s" % (
+            time.time() - start_time, stats['throughput'], stats['latency_mean'], classifiedSentimentFile))
+    elif verbose:
+        print("Finished in %.1fs! The results are in:\n%s" % (time.time() - start_time, classifiedSentimentFile))
+    return classifiedSentimentFile
+
+
+def _one_line(message):
+    if not isinstance(message, str):
+        message = str(message)
+    return message.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+
+
+def _write_lines(stream, lines):
+    try:
+        stream.write(''.join(l + '\n' for l in lines))
+        stream.flush()
+    except (BrokenPipeError, ValueError):
+        # the process died; the reader reports it
+        pass
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import threading
+import time
+import os
+
+
+# command line options of each SentiStrength version
+EN_OPTIONS = ['utf8']
+JP_OPTIONS = ['negatingWordsOccurAfterSentiment', 'maxWordsAfterSentimentToNegate', '1',
+              'negatingWordsDontOccurBeforeSentiment', 'maxWordsAfterBoosters', '1']
+
+
+def sentistrength_command(sentistrength_path, sentistrength_dictionary_path, file_to_classify, options):
+    '''
+    Argument list of a SentiStrength run that classifies every line of a file.
+
+    Input:
+        sentistrength_path: file path to the SentiStrength program
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files
+        file_to_classify: file with one text per line
+        options: extra SentiStrength options (EN_OPTIONS or JP_OPTIONS)
+    Output:
+        list of command line arguments
+    '''
+    return (['java', '-jar', sentistrength_path, 'sentidata', sentistrength_dictionary_path,
+             'input', file_to_classify] + list(options))
+
+
+def output_path_of(file_to_classify):
+    '''
+    File SentiStrength writes its results to: [input without extension]_out.txt
+    '''
+    return os.path.splitext(file_to_classify)[0] + "_out.txt"
+
+
+def split_lines(path, n_shards):
+    '''
+    Split a text file into up to n_shards files of roughly equal size, cut at line ends.
+
+    Input:
+        path: file path to split
+        n_shards: number of shards
+    Output:
+        list of (shard path, number of lines) in the original order
+    '''
+    size = os.path.getsize(path)
+    root, ext = os.path.splitext(path)
+
+    # byte offsets of the shard starts, moved forward to the next line start
+    starts = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, starts[-1]))
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                f.readline()
+            if f.tell() < size and f.tell() > starts[-1]:
+                starts.append(f.tell())
+    starts.append(size)
+
+    shards = []
+    with open(path, 'rb') as f:
+        for i, (start, stop) in enumerate(zip(starts[:-1], starts[1:])):
+            shard_path = '%s.part%03d%s' % (root, i, ext)
+            lines = 0
+            f.seek(start)
+            remaining = stop - start
+            block = b''
+            with open(shard_path, 'wb') as fw:
+                while remaining > 0:
+                    block = f.read(min(remaining, 16 * 1024 * 1024))
+                    lines += block.count(b'\n')
+                    fw.write(block)
+                    remaining -= len(block)
+                if block and not block.endswith(b'\n'):
+                    # unterminated last line
+                    lines += 1
+            shards.append((shard_path, lines))
+    return shards
+
+
+class _Processes(object):
+    '''
+    SentiStrength processes of the shards of one run: once a process fails, the running ones are killed
+    and the shards not started yet are skipped, so the run fails without waiting for the other shards.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = []
+        self.failed = None
+
+    def run(self, part, command, log_path):
+        '''
+        Run one SentiStrength process to completion, logging its output, and return its exit status
+        (None if it was skipped after another shard failed).
+        '''
+        with open(log_path, 'wb') as log:
+            with self._lock:
+                if self.failed is not None:
+                    return None
+                process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+                self._running.append(process)
+            status = process.wait()
+        with self._lock:
+            self._running.remove(process)
+            if status != 0 and self.failed is None:
+                self.failed = (part, status, log_path)
+                for other in self._running:
+                    other.kill()
+        return status
+
+
+def run_sentistrength(file_to_classify, sentistrength_path, sentistrength_dictionary_path, options,
+                      shards=1, workers=None, verbose=True):
+    '''
+    Run SentiStrength on a file of texts and wait for it to finish.
+    With shards > 1, the file is split into line-aligned shards that are scored by up to workers
+    SentiStrength processes at a time, and their outputs are concatenated in the original order.
+    Raises RuntimeError if a process fails, after killing the processes of the other shards, or if a shard's
+    output does not have one line per input line.
+
+    Input:
+        file_to_classify: file with one text per line
+        sentistrength_path: file path to the SentiStrength program
+        sentistrength_dictionary_path: file path to the folder of the SentiStrength dictionary files
+        options: extra SentiStrength options (EN_OPTIONS or JP_OPTIONS)
+        shards: number of shards to split the file into (default 1)
+        workers: number of SentiStrength processes to run at once (default: one per shard)
+        verbose: print progress or not (default True)
+    Output:
+        classifiedSentimentFile: file path of the SentiStrength results ([file_to_classify]_out.txt)
+    '''
+    classifiedSentimentFile = output_path_of(file_to_classify)
+    start_time = time.time()
+
+    if shards > 1:
+        parts = split_lines(file_to_classify, shards)
+    else:
+        parts = [(file_to_classify, None)]
+
+    commands = [sentistrength_command(sentistrength_path, sentistrength_dictionary_path, part, options)
+                for part, _ in parts]
+    if verbose:
+        print("Running SentiStrength on file " + file_to_classify + " in %d shard(s) with command:" % len(parts))
+        print(' '.join(commands[0]))
+
+    logs = [os.path.splitext(part)[0] + '_log.txt' for part, _ in parts]
+    processes = _Processes()
+    with ThreadPoolExecutor(max_workers=workers or len(parts)) as pool:
+        list(pool.map(processes.run, [part for part, _ in parts], commands, logs))
+
+    if processes.failed is not None:
+        part, status, log = processes.failed
+        with open(log, 'rb') as f:
+            message = f.read()[-2000:].decode('utf-8', 'replace')
+        raise RuntimeError("SentiStrength exited with status %d on %s:\n%s" % (status, part, message))
+    for log in logs:
+        os.remove(log)
+
+    if shards > 1:
+        # concatenate shard outputs in order, keeping only the first header line
+        with open(classifiedSentimentFile, 'wb') as fw:
+            for i, (part, lines) in enumerate(parts):
+                part_output = output_path_of(part)
+                with open(part_output, 'rb') as f:
+                    header = f.readline()
+                    if i == 0:
+                        fw.write(header)
+                    written = _copy_counting_lines(f, fw)
+                if written != lines:
+                    raise RuntimeError("SentiStrength output %s has %d lines for the %d lines of %s" % (
+                        part_output, written, lines, part))
+                os.remove(part)
+                os.remove(part_output)
+
+    if verbose:
+        print("Finished in %.1fs! The results are in:\n%s" % (time.time() - start_time, classifiedSentimentFile))
+    return classifiedSentimentFile
+
+
+def _copy_counting_lines(f, fw):
+    lines = 0
+    last = b''
+    for block in iter(lambda: f.read(16 * 1024 * 1024), b''):
+        lines += block.count(b'\n')
+        fw.write(block)
+        last = block
+    if last and not last.endswith(b'\n'):
+        fw.write(b'\n')
+        lines += 1
+    return lines
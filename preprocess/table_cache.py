@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+import hashlib
+import shutil
+import json
+import time
+import os
+
+from exposure_io import load_array
+from tweet_tables import read_scored_tweets
+
+
+# bump when the cached layout or the typed loading changes, so old entries are never reused
+CACHE_VERSION = 1
+
+INDEX_FILE = 'hashes.json'
+META_FILE = 'meta.json'
+
+
+def content_hash(path, block_size=16 * 1024 * 1024):
+    '''
+    blake2b hash of a file's contents, read in blocks.
+    '''
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class TableCache(object):
+    '''
+    Parse-once cache of typed tweet tables.
+    On first read a table is parsed with read_scored_tweets and saved as one .npy file per column
+    (categorical ids as codes plus categories); later reads memory-map those files instead of parsing the csv.
+
+    Entries are keyed by the source path, size, mtime and content hash, so a changed source is never served
+    from a stale entry; stale entries of a source are deleted when it is cached again. The content hash of
+    an unchanged (path, size, mtime) is remembered so it is not recomputed every run. When the cache
+    directory grows over max_bytes, the least recently used entries are evicted.
+
+    Input:
+        cache_dir: directory holding the cache
+        max_bytes: size bound of the cache directory (default 20 GB)
+    '''
+
+    def __init__(self, cache_dir, max_bytes=20 * 10**9):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def read_scored_tweets(self, path, tweet_type='friend'):
+        '''
+        Cached read_scored_tweets.
+
+        Input:
+            path: path of scored tweets csv
+            tweet_type: "user" or "friend"
+        Output:
+            df: dataframe, memory-mapped from the cache where possible
+        '''
+        key, source = self._key(path, tweet_type)
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            os.utime(os.path.join(entry, META_FILE), None)
+            return self._load(entry)
+
+        df = read_scored_tweets(path, tweet_type)
+        self._invalidate(source, tweet_type)
+        self._store(entry, df, source, tweet_type)
+        self._evict()
+        return df
+
+    def _key(self, path, tweet_type):
+        source = os.path.abspath(str(path))
+        stat = os.stat(source)
+        stat_key = '%s|%d|%d' % (source, stat.st_size, stat.st_mtime_ns)
+
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        index = {}
+        if os.path.isfile(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+        if stat_key not in index:
+            # forget hashes of older versions of this source
+            index = dict((k, v) for k, v in index.items() if not k.startswith(source + '|'))
+            index[stat_key] = content_hash(source)
+            _write_json(index_path, index)
+
+        key = hashlib.sha1(('%s|%s|%s|%d' % (stat_key, index[stat_key], tweet_type, CACHE_VERSION)).encode('utf-8'))
+        return key.hexdigest(), source
+
+    def _store(self, entry, df, source, tweet_type):
+        tmp = entry + '.tmp%d' % os.getpid()
+        os.makedirs(tmp)
+        columns = []
+        for c in df.columns:
+            if isinstance(df[c].dtype, pd.CategoricalDtype):
+                np.save(os.path.join(tmp, c + '.codes.npy'), np.asarray(df[c].cat.codes.values))
+                np.save(os.path.join(tmp, c + '.categories.npy'), np.asarray(df[c].cat.categories.values))
+                columns.append({'name': c, 'categorical': True})
+            else:
+                np.save(os.path.join(tmp, c + '.npy'), np.asarray(df[c].values))
+                columns.append({'name': c, 'categorical': False})
+        _write_json(os.path.join(tmp, META_FILE), {'source': source, 'tweet_type': tweet_type,
+                                                    'columns': columns, 'rows': len(df), 'created': time.time()})
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another run cached the same table first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _load(self, entry):
+        with open(os.path.join(entry, META_FILE)) as f:
+            meta = json.load(f)
+        data = {}
+        for column in meta['columns']:
+            c = column['name']
+            if column['categorical']:
+                codes = load_array(os.path.join(entry, c + '.codes.npy'))
+                categories = np.load(os.path.join(entry, c + '.categories.npy'))
+                data[c] = pd.Categorical.from_codes(codes, categories=categories)
+            else:
+                data[c] = load_array(os.path.join(entry, c + '.npy'))
+        return pd.DataFrame(data, columns=[c['name'] for c in meta['columns']], copy=False)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry, META_FILE)
+            if os.path.isfile(meta_path):
+                entries.append(entry)
+        return entries
+
+    def _invalidate(self, source, tweet_type):
+        for entry in self._entries():
+            with open(os.path.join(entry, META_FILE)) as f:
+                meta = json.load(f)
+            if meta['source'] == source and meta['tweet_type'] == tweet_type:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _evict(self):
+        # least recently used first
+        entries = sorted(self._entries(), key=lambda e: os.path.getmtime(os.path.join(e, META_FILE)))
+        sizes = dict((e, _dir_size(e)) for e in entries)
+        total = sum(sizes.values())
+        for entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _write_json(path, obj):
+    tmp = path + '.tmp%d' % os.getpid()
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.rename(tmp, path)
@@ -0,0 +1,193 @@
+# coding: utf-8
+from bisect import bisect_right
+import io
+import sys
+import time
+
+
+# segmented dictionary files of Japanese SentiStrength, in the order their terms are merged
+SEGMENTED_FILES = ['NegatingWordListSeg.txt', 'QuestionWordsSeg.txt', 'BoosterWordListSeg.txt',
+                   'SentimentLookupTableSeg.txt', 'NegationExceptionListSeg.txt']
+
+
+def load_terms(sentistrength_dictionary_path):
+    '''
+    Read all segmented dictionary terms (the text before the first tab of every line).
+
+    Input:
+        sentistrength_dictionary_path: file path to the folder of the Japanese SentiStrength dictionary files
+    Output:
+        termsList: list of terms, in file and line order
+    '''
+    termsList = []
+    for filename in SEGMENTED_FILES:
+        with io.open(sentistrength_dictionary_path + "segmented/" + filename, mode='r', encoding='utf-8') as f:
+            for line in f:
+                line = line[0:line.find('\t')]
+                line = line.replace('\n','').replace('\r','')
+                termsList.append(line)
+    return termsList
+
+
+def processLine(linewrite, termsList):
+    '''
+    Remove all spaces within a segmented term in the input string.
+    Input:
+    	linewrite: input string
+        termsList: list of terms from dictionary files
+    Output:
+    	linewrite: processed string
+    '''
+    for term in termsList:
+        if linewrite.find(term) != -1:
+            newterm = term.replace(' ','')
+            linewrite = linewrite.replace(term, newterm)
+    return linewrite
+
+
+class TermMerger(object):
+    '''
+    processLine with the terms compiled once into an Aho-Corasick automaton.
+
+    processLine replaces the terms one by one, in list order, in the string left by the earlier terms.
+    Only terms with a space change a string, so only those are compiled. merge scans the current string
+    once for all of them, applies the first term (in list order, after the last applied one) that it
+    contains, and scans again from there, which gives the same result as processLine.
+    Most lines contain no term and are scanned once.
+
+    Input:
+        termsList: list of terms from dictionary files
+    '''
+
+    def __init__(self, termsList):
+        # positions of every distinct term in termsList
+        self.terms = []
+        self.positions = []
+        ids = {}
+        for position, term in enumerate(termsList):
+            if ' ' not in term:
+                continue
+            if term not in ids:
+                ids[term] = len(self.terms)
+                self.terms.append(term)
+                self.positions.append([])
+            self.positions[ids[term]].append(position)
+        self.merged = [term.replace(' ', '') for term in self.terms]
+        self._build()
+
+    def _build(self):
+        # trie
+        self.goto = [{}]
+        self.output = [[]]
+        for term_id, term in enumerate(self.terms):
+            state = 0
+            for c in term:
+                nxt = self.goto[state].get(c)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][c] = nxt
+                    self.goto.append({})
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(term_id)
+
+        # failure links, breadth first; outputs include those of the failure state
+        self.fail = [0] * len(self.goto)
+        frontier = list(self.goto[0].values())
+        while frontier:
+            next_frontier = []
+            for state in frontier:
+                for c, nxt in self.goto[state].items():
+                    f = self.fail[state]
+                    while f and c not in self.goto[f]:
+                        f = self.fail[f]
+                    if state:
+                        self.fail[nxt] = self.goto[f].get(c, 0)
+                    self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+                    next_frontier.append(nxt)
+            frontier = next_frontier
+        self.delta = [dict(g) for g in self.goto]
+
+    def find(self, line):
+        '''
+        Ids of the terms contained in line.
+        '''
+        delta = self.delta
+        output = self.output
+        found = set()
+        state = 0
+        for c in line:
+            nxt = delta[state].get(c)
+            if nxt is None:
+                nxt = self._transition(state, c)
+            state = nxt
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def _transition(self, state, c):
+        # follow failure links once and remember the result, so each (state, character) is resolved once
+        s = state
+        while s and c not in self.goto[s]:
+            s = self.fail[s]
+        nxt = self.goto[s].get(c, 0)
+        self.delta[state][c] = nxt
+        return nxt
+
+    def merge(self, linewrite):
+        '''
+        Remove all spaces within a segmented term in the input string (same output as processLine).
+        Input:
+            linewrite: input string
+        Output:
+            linewrite: processed string
+        '''
+        if ' ' not in linewrite:
+            return linewrite
+        last = -1
+        while True:
+            best = None
+            for term_id in self.find(linewrite):
+                positions = self.positions[term_id]
+                i = bisect_right(positions, last)
+                if i < len(positions) and (best is None or positions[i] < best[0]):
+                    best = (positions[i], term_id)
+            if best is None:
+                return linewrite
+            last, term_id = best
+            linewrite = linewrite.replace(self.terms[term_id], self.merged[term_id])
+
+
+def compare_term_merging(lines, termsList):
+    '''
+    Check that TermMerger.merge matches processLine on every line and report the speedup.
+
+    Input:
+        lines: list of segmented lines
+        termsList: list of terms from dictionary files
+    Output:
+        before: seconds taken by processLine
+        after: seconds taken by TermMerger (including building the automaton)
+    '''
+    start = time.time()
+    expected = [processLine(l, termsList) for l in lines]
+    before = time.time() - start
+
+    start = time.time()
+    merger = TermMerger(termsList)
+    merged = [merger.merge(l) for l in lines]
+    after = time.time() - start
+
+    mismatches = sum(1 for a, b in zip(expected, merged) if a != b)
+    if mismatches:
+        raise ValueError("TermMerger differs from processLine on %d of %d lines" % (mismatches, len(lines)))
+    print("%d lines, %d terms: processLine %.2fs, TermMerger %.2fs (%.1fx faster)" % (
+        len(lines), len(termsList), before, after, before / max(after, 1e-9)))
+    return before, after
+
+
+if __name__ == '__main__':
+    # python term_merger.py [dictionary folder/] [segmented messages file]
+    with io.open(sys.argv[2], mode='r', encoding='utf-8') as f:
+        lines = [l.rstrip('\n') for l in f]
+    compare_term_merging(lines, load_terms(sys.argv[1]))
@@ -0,0 +1,143 @@
+import datetime
+import sqlite3
+import time
+import csv
+import sys
+
+
+# number of stored (non-reply) statuses of a friend written per user when no start time is given
+TIMELINE_COUNT = 200
+
+
+def twitter_time(created_at):
+    '''
+    Status created_at ("Wed Oct 10 20:19:24 +0000 2018") as written in the statuses csv files ("2018-10-10 20:19:24").
+    '''
+    return datetime.datetime.strptime(created_at, '%a %b %d %H:%M:%S %z %Y').strftime('%Y-%m-%d %H:%M:%S')
+
+
+class TimelineStore(object):
+    '''
+    Persistent SQLite store of friend timelines, shared across users, rounds and waves of the collection: the
+    statuses fetched for every friend, and per friend the newest status id and the time it was last fetched,
+    so popular accounts are fetched once and afterwards only their new statuses (since_id) are requested.
+    The rows of the friends statuses csv of any user can be written from the store without a request.
+
+    Input:
+        path: SQLite database file
+    '''
+
+    def __init__(self, path):
+        self.path = str(path)
+        # collectors of both countries can share the store
+        self._db = sqlite3.connect(self.path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS friends (friendid INTEGER PRIMARY KEY, newest_id INTEGER, '
+                         'fetched REAL, inaccessible INTEGER)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS statuses (friendid INTEGER, id INTEGER, lang TEXT, message TEXT, '
+                         'updated_time TEXT, PRIMARY KEY (friendid, id)) WITHOUT ROWID')
+        self._db.commit()
+
+    def state(self, friendid):
+        '''
+        Output:
+            (newest status id or None, time of the last fetch in epoch seconds, inaccessible or not),
+            or None if the friend was never fetched
+        '''
+        row = self._db.execute('SELECT newest_id, fetched, inaccessible FROM friends WHERE friendid = ?',
+                               (int(friendid),)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], bool(row[2])
+
+    def add(self, friendid, statuses, fetched=None):
+        '''
+        Store statuses of a friend (status dictionaries of user_timeline) and update its newest status id.
+
+        Input:
+            friendid: friend id
+            statuses: list of status dictionaries, or None if the timeline is inaccessible
+            fetched: time of the fetch in epoch seconds (default now)
+        '''
+        fetched = time.time() if fetched is None else fetched
+        friendid = int(friendid)
+        if statuses is None:
+            self._db.execute('INSERT INTO friends VALUES (?, NULL, ?, 1) ON CONFLICT (friendid) DO UPDATE SET '
+                             'fetched = excluded.fetched, inaccessible = 1', (friendid, fetched))
+        else:
+            self._db.executemany('INSERT OR REPLACE INTO statuses VALUES (?, ?, ?, ?, ?)',
+                                 [(friendid, int(s['id']), s.get('lang'), s['text'], twitter_time(s['created_at']))
+                                  for s in statuses])
+            newest = max([int(s['id']) for s in statuses], default=None)
+            self._db.execute('INSERT INTO friends VALUES (?, ?, ?, 0) ON CONFLICT (friendid) DO UPDATE SET '
+                             'newest_id = nullif(max(coalesce(newest_id, 0), coalesce(excluded.newest_id, 0)), 0), '
+                             'fetched = excluded.fetched, inaccessible = 0', (friendid, newest, fetched))
+        self._db.commit()
+
+    def rows(self, friendid, userid, lang, count=TIMELINE_COUNT, start=None):
+        '''
+        Rows of the friends statuses csv (friendid, userid, message, updated_time): the friend's statuses in lang
+        among its count newest stored statuses, or with a start time ('YYYY-MM-DD HH:MM:SS') among all its stored
+        statuses from start on, newest first.
+        Replies are never fetched (exclude_replies), so count applies to non-reply statuses: a friend can get more
+        rows than from one count=200 page, where the API counts replies before dropping them. Use a start time to
+        get the same statuses however the store was filled.
+        '''
+        if start is None:
+            query = 'SELECT message, updated_time, lang FROM statuses WHERE friendid = ? ORDER BY id DESC LIMIT ?'
+            params = (int(friendid), count)
+        else:
+            query = ('SELECT message, updated_time, lang FROM statuses WHERE friendid = ? AND updated_time >= ? '
+                     'ORDER BY id DESC')
+            params = (int(friendid), start)
+        return [[friendid, userid, message, updated_time]
+                for message, updated_time, status_lang in self._db.execute(query, params)
+                if status_lang == lang]
+
+    def write_friend_statuses(self, userid, friends, output_path, lang, count=TIMELINE_COUNT, start=None):
+        '''
+        Append the rows of a user's friends to a friends statuses csv from the store, without any request.
+
+        Input:
+            userid: user id
+            friends: list of friend ids
+            output_path: friends statuses csv (friendid,userid,message,updated_time)
+            lang: status language, "en" or "ja"
+            count: newest stored (non-reply) statuses considered per friend (default 200, see rows)
+            start: oldest status time written instead ('YYYY-MM-DD HH:MM:SS') (default None)
+        Output:
+            number of rows written
+        '''
+        numRows = 0
+        with open(output_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            for friendid in friends:
+                rows = self.rows(friendid, userid, lang, count, start)
+                writer.writerows(rows)
+                numRows += len(rows)
+        return numRows
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    # rebuild the friends statuses csv of users from the store and their friends lists
+    # python timeline_store.py [store .db] [_users_friends.txt] [output _statuses_friends.csv] [en or ja] [start time]
+    friends = {}
+    with open(sys.argv[2]) as f:
+        for line in f:
+            userid, friendid = line.split()
+            friends.setdefault(userid, []).append(friendid)
+    with open(sys.argv[3], 'w') as f:
+        f.write('friendid,userid,message,updated_time\n')
+    with TimelineStore(sys.argv[1]) as store:
+        for userid in friends:
+            store.write_friend_statuses(userid, friends[userid], sys.argv[3], sys.argv[4],
+                                        start=sys.argv[5] if len(sys.argv) > 5 else None)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import sys
+
+from exposure_io import AFFECTS
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+ID_COLUMNS = {
+    'user': ['userid'],
+    'friend': ['friendid', 'userid'],
+}
+
+# columns calculate_exposure needs from the output of process_sentistrength_results
+SCORED_DTYPES = dict([('friendid', np.int64), ('userid', np.int64)] + [(a, np.uint8) for a in AFFECTS])
+
+
+def scored_columns(tweet_type):
+    '''
+    Columns read from a scored tweets csv: ids, updated_time and the five affect flags.
+    '''
+    return ID_COLUMNS[tweet_type] + ['updated_time'] + AFFECTS
+
+
+def raw_columns(tweet_type):
+    '''
+    Columns kept from a raw tweets csv (everything but the message text).
+    '''
+    return ID_COLUMNS[tweet_type] + ['updated_time']
+
+
+def parse_times(times):
+    '''
+    Parse 'YYYY-MM-DD HH:MM:SS' strings in one vectorized step.
+
+    Input:
+        times: series of time strings
+    Output:
+        series of datetime64[ns] (int64 nanoseconds since the epoch)
+    '''
+    return pd.to_datetime(times, format=TIME_FORMAT, cache=True).astype('datetime64[ns]')
+
+
+def read_scored_tweets(path, tweet_type='friend', chunksize=None):
+    '''
+    Read a scored tweets csv (output of process_sentistrength_results) with compact dtypes:
+    only the needed columns, uint8 affect flags, updated_time parsed to datetime64[ns] (int64 epoch nanoseconds),
+    and ids as categoricals of the int64 ids (int32 codes per row). Chunks keep plain int64 ids,
+    since their categories would differ from chunk to chunk.
+
+    Input:
+        path: path of scored tweets csv
+        tweet_type: "user" or "friend"
+        chunksize: if given, return an iterator of dataframes of this many rows (default None)
+    Output:
+        df: dataframe (or iterator of dataframes when chunksize is given)
+    '''
+    columns = scored_columns(tweet_type)
+    dtypes = dict((c, SCORED_DTYPES[c]) for c in columns if c in SCORED_DTYPES)
+    reader = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    if chunksize is None:
+        df = _typed(reader, columns)
+        for c in ID_COLUMNS[tweet_type]:
+            df[c] = df[c].astype('category')
+        return df
+    return (_typed(chunk, columns) for chunk in reader)
+
+
+def read_raw_tweets(path, tweet_type='friend', chunksize=None, messages=False):
+    '''
+    Read the id and time columns of a raw tweets csv, skipping the message text unless messages is True.
+    updated_time is kept as the original string, since it is only written back out.
+
+    Input:
+        path: path of raw tweets csv
+        tweet_type: "user" or "friend"
+        chunksize: if given, return an iterator of dataframes of this many rows (default None)
+        messages: also read the message column (default False)
+    Output:
+        df: dataframe (or iterator of dataframes when chunksize is given)
+    '''
+    columns = raw_columns(tweet_type) + (['message'] if messages else [])
+    dtypes = dict((c, np.int64) for c in ID_COLUMNS[tweet_type])
+    dtypes['updated_time'] = str
+    if messages:
+        dtypes['message'] = object
+    return pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def _typed(df, columns):
+    df['updated_time'] = parse_times(df['updated_time'])
+    return df[columns]
+
+
+def memory_usage(df):
+    '''
+    Resident memory of a dataframe in bytes, including object (string) contents.
+    '''
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compare_memory(path, tweet_type='friend'):
+    '''
+    Report the memory of a scored tweets csv loaded with default dtypes (as before) and with read_scored_tweets.
+
+    Input:
+        path: path of scored tweets csv
+        tweet_type: "user" or "friend"
+    Output:
+        before: bytes with pd.read_csv defaults and a separate pd.to_datetime pass
+        after: bytes with read_scored_tweets
+    '''
+    df = pd.read_csv(path)
+    df['updated_time'] = pd.to_datetime(df['updated_time'], format=TIME_FORMAT)
+    before = memory_usage(df)
+    del df
+
+    after = memory_usage(read_scored_tweets(path, tweet_type))
+    print("%s: %.1f MB before, %.1f MB after (%.1fx less)" % (path, before / 1e6, after / 1e6, before / float(max(after, 1))))
+    return before, after
+
+
+if __name__ == '__main__':
+    compare_memory(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'friend')
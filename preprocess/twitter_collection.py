@@ -1,10 +1,17 @@
 import tweepy
 import datetime
 import time
-import unicodecsv
+import csv
 import jsonpickle
 import botometer
 import logging
+import threading
+import os
+
+from friend_timelines import DEFAULT_BASE_URL, MAX_TIMELINE_STATUSES, collect_friend_timelines, window_start
+from timeline_store import TimelineStore
+from bot_scoring import BotCheckPool, BotScoreCache
+from seen_users import SeenUserRegistry
 
 #####################################################################################
 ## Customize the variables in this box
@@ -17,6 +24,15 @@ import logging
 country = 'USA' # 'USA' or 'japan'
 date = '12.16.19.9pm'
 timeelapse = 1      # number of days to collect
+concurrency = 16    # friend timelines fetched at a time
+api_base_url = DEFAULT_BASE_URL     # e.g. http://localhost:8080 for mock_twitter_api.py
+timeline_store_path = 'data/friend_timelines.db'   # friend timelines shared across users, rounds and waves
+timeline_max_age = 0        # seconds a stored friend timeline is used without a request (0: always fetch new statuses)
+bot_score_cache_path = 'data/bot_scores.db'     # Botometer scores shared across rounds and waves
+bot_score_ttl = 90 * 86400  # seconds a bot score is reused
+bot_check_workers = 4       # Botometer checks at a time
+seen_users_path = 'data/seen_users.db'      # users already sampled, shared by the US and Japan collectors
+seen_users_bloom_capacity = 10000000        # users the Bloom filter in front of it is sized for (None: no Bloom filter)
 
 # auth keys
 consumer_key = ''
@@ -59,27 +75,13 @@ class MyStreamListener(tweepy.StreamListener):
 
     # overload the on_status method
     def on_status(self, status):
+        # stop the stream once a bot check accepted this round's user
+        if users:
+            return False
         try:
-            result = bom.check_account(status.user.id)
-
-            # if user fits filter criteria   
-            if status.place.country_code == country_code and status.user.lang == lang and status.lang == lang and result['display_scores']['user'] < 1 and status.user.id_str not in existingUsers and status.user.id_str not in usersThisRound:
-                print status.user.id
-                print "bot result: ", result['display_scores']['user']
-
-                with open(file_statuses_json, 'a') as fs:
-
-                    fs.write(jsonpickle.encode(status._json, unpicklable=False) + '\n')
-
-                with open(file_userids, 'a') as fu:
-                    users.add(status.user.id_str)
-                    fu.write(status.user.id_str + '\n')
-                fu.close()
-
-                return False
-
-            else:
-                return True
+            # cheap filters first; the bot check of the candidates runs in botChecks
+            if status.place is not None and status.place.country_code == country_code and status.user.lang == lang and status.lang == lang and status.user.id not in seenUsers:
+                botChecks.submit(status, collectionRound)
 
         # error handling
         except BaseException as e:
@@ -97,13 +99,30 @@ class MyStreamListener(tweepy.StreamListener):
         return True
 
 
-# existing user ID list
-existingUsers = []
-with open('data/' + country+'_existing_users.txt', 'r') as fexist:
-    for line in fexist:
-        existingUsers.append(line[:-1])
-existingUsers = set(existingUsers)
-fexist.close()
+# called by the bot check workers with candidates that are not bots
+acceptLock = threading.Lock()
+def accept_user(status, score, candidateRound):
+    with acceptLock:
+        # one user per round, from the candidates streamed in this round (those still queued from an earlier
+        # round are dropped); the user is registered before anything is written, so a crash cannot sample it again
+        if candidateRound != collectionRound or users or not seenUsers.add(status.user.id, country):
+            return
+        print(status.user.id)
+        print("bot result: ", score)
+
+        with open(file_statuses_json, 'a') as fs:
+            fs.write(jsonpickle.encode(status._json, unpicklable=False) + '\n')
+
+        with open(file_userids, 'a') as fu:
+            fu.write(status.user.id_str + '\n')
+        users.add(status.user.id_str)
+
+
+# users already sampled
+seenUsers = SeenUserRegistry(seen_users_path, bloom_capacity=seen_users_bloom_capacity)
+# users sampled before the registry
+if not seenUsers.count(country) and os.path.exists('data/' + country + '_existing_users.txt'):
+    print('%d existing users registered' % seenUsers.import_text('data/' + country + '_existing_users.txt', country))
 
 # files to save things too
 file_users_statuses = 'data/' + country + '_stream_' + date + '_statuses_users.csv'
@@ -127,19 +146,26 @@ f.close()
 places = api.geo_search(query=country, granularity='country')
 coordinates = places[0].bounding_box.coordinates
 geocoord = [coordinates[0][0][0], coordinates[0][0][1], coordinates[0][2][0], coordinates[0][2][1]]
-print geocoord
+print(geocoord)
 
-usersThisRound = set([])
+users = set([])
+collectionRound = 0
+
+# bot checks of stream candidates, off the streaming thread
+botChecks = BotCheckPool(lambda user_id: bom.check_account(user_id), accept_user,
+                         BotScoreCache(bot_score_cache_path, ttl=bot_score_ttl), workers=bot_check_workers)
 
 starttime = datetime.datetime.now()
 
 # collection
 usernum = 0
 while (datetime.datetime.now()-starttime).days < timeelapse:
-    print usernum
+    print(usernum)
 
     ## STREAM USER
-    users = set([])
+    with acceptLock:
+        users.clear()
+        collectionRound += 1
     # connecting to the twitter streaming API
     auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
     auth.set_access_token(access_token, access_token_secret)
@@ -157,7 +183,7 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
     twitter_stream.filter(locations=geocoord)
 
     user = list(users)[0]
-    print 'userid: ', user
+    print('userid: ', user)
 
     userAccessible = 1
 
@@ -166,14 +192,14 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
     auth = tweepy.AppAuthHandler(consumer_key, consumer_secret)
     api = tweepy.API(auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
 
-    print 'getting friends...'
+    print('getting friends...')
     friends = []
 
     while True:
         try:
             for item in tweepy.Cursor(api.friends_ids, user_id=user).items():
                 friends.append(item)
-            print 'number of friends: ', len(friends)
+            print('number of friends: ', len(friends))
             break
         except tweepy.RateLimitError:
             print('sleep 15 minutes')
@@ -190,12 +216,12 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
             continue
 
     ## GET STATUSES
-    print 'getting user statuses...'
+    print('getting user statuses...')
     while True:
         try:
-            with open(file_users_statuses, 'a') as f:
-                writer = unicodecsv.writer(f, encoding='utf-8')
-                print 'user status user: ', user
+            with open(file_users_statuses, 'a', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                print('user status user: ', user)
                 for status in api.user_timeline(user_id=user, include_rts=False, trim_user=True, count=200):
                     row = []
                     if status.lang == lang:
@@ -210,8 +236,8 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
             time.sleep(480)
             continue
         except tweepy.TweepError as e:
-            print('At sub %s, TweepError %s ' % (str(sub), e.reason))
-            if e.message == 'Over capacity':
+            print('At sub %s, TweepError %s ' % (str(user), e.reason))
+            if e.reason == 'Over capacity':
                 print('sleep 8 minutes')
                 time.sleep(480)
             elif e.reason == 'Twitter error response: status code = 429':
@@ -230,51 +256,25 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
 
 
     ## GET FRIENDS STATUSES
-    print 'getting friends statuses...'
-    i = 0
-    numInaccessible = 0
-    while i < len(friends):
-        print i
-        sub = friends[i]
-        try:
-            with open(file_friends_statuses, 'a') as f:
-                writer = unicodecsv.writer(f, encoding='utf-8')
-                for status in api.user_timeline(user_id=sub, trim_user=True, exclude_replies=True, count=200):
-                    # for status in tweepy.Cursor(api.user_timeline, user_id=sub, exclude_replies=True, trim_user=True).items(100):
-                    row = []
-                    if status.lang == lang:
-                        # if status.is_quote_status:
-                        #     if hasattr(status, 'quoted_states'):
-                        #         print status.text + status.quoted_status.text
-                        #         statuslist.append(status.text + status.quoted_status.text)
-                        # else:
-                        row.append(sub)
-                        row.append(user)
-                        row.append(status.text)
-                        row.append(status.created_at)
-                        writer.writerow(row)
-            i += 1
-
-        except tweepy.RateLimitError:
-            print('sleep 8 minutes')
-            time.sleep(480)
-            continue
-        except tweepy.TweepError as e:
-            print('At sub %s, TweepError %s' % (str(sub), e.reason))
-            if e.reason == 'Twitter error response: status code = 429':
-                print('sleep 8 minutes')
-                time.sleep(480)
-            elif 'Failed to send request: HTTPSConnectionPool' in e.reason:
-                print ('sleep 10 seconds')
-                time.sleep(10)
-            else:
-                numInaccessible += 1
-                i += 1
-            continue
-
-    print "write to header..."
+    # concurrent requests sharing one rate limiter (see friend_timelines.py)
+    print('getting friends statuses...')
+    # statuses from the week before now, the friend statuses calculate_exposure uses
+    with TimelineStore(timeline_store_path) as store:
+        counts = collect_friend_timelines(user, friends, file_friends_statuses, lang, consumer_key, consumer_secret,
+                                          base_url=api_base_url, concurrency=concurrency, store=store,
+                                          max_age=timeline_max_age, start=window_start())
+    numInaccessible = counts['inaccessible'] + counts['failed']
+    print('%d statuses, %d requests (%d since_id, %d friends from the store, %d rate limited, %d retried), %d inaccessible' % (
+        counts['statuses'], counts['requests'], counts['deltas'], counts['stored'], counts['rate_limited'],
+        counts['retries'], numInaccessible))
+    print('%d requests against %d for one page per friend; paging stopped at the window: %d requests and %.1f MB saved '
+          'against paging back %d statuses, %d statuses from before the window' % (
+        counts['requests'], counts['friends'], counts['requests_saved'], counts['bytes_saved'] / 1e6,
+        MAX_TIMELINE_STATUSES, counts['outside']))
+
+    print("write to header...")
     with open(file_header, 'a') as hf:
-        hf.write(str(sub) + ',' + str(len(friends)) + ',' + str(len(friends)-numInaccessible) + '\n')
+        hf.write(str(user) + ',' + str(len(friends)) + ',' + str(len(friends)-numInaccessible) + '\n')
 
     # write to friends
     with open(file_users_friends, 'a') as outf:
@@ -282,15 +282,10 @@ while (datetime.datetime.now()-starttime).days < timeelapse:
             outf.write(str(user) + ' ' + str(friend) + '\n')
     outf.close()
 
-    usersThisRound.add(user)
-    print 'user finished', usernum
+    print('user finished', usernum)
     usernum += 1
 
-# save user to existing users
-with open('data/' + country+'_existing_users.txt', 'a') as fexist:
-    with open(file_userids, 'r') as fu:    
-        for line in fu:
-            fexist.write(line)
-    fu.close()
-fexist.close()
+botChecks.close()
+print('bot checks: %(submitted)d candidates (%(dropped)d dropped), %(checked)d checked, %(cached)d from the cache, %(accepted)d accepted' % botChecks.counts)
+seenUsers.close()
 
@@ -0,0 +1,35 @@
+import types
+
+from bot_scoring import BotCheckPool, BotScoreCache, StubBotometer
+
+
+def status(userid):
+    return types.SimpleNamespace(user=types.SimpleNamespace(id=userid, id_str=str(userid)))
+
+
+def test_accept_gets_the_round_of_each_candidate(tmp_path):
+    stub = StubBotometer(latency=0.01, bot_share=0.0)
+    accepted = []
+    pool = BotCheckPool(stub.check_account, lambda s, score, tag: accepted.append((s.user.id, tag)),
+                        BotScoreCache(str(tmp_path / 'bots.db')), workers=2)
+    for userid in range(5):
+        assert pool.submit(status(userid), tag=1)
+    for userid in range(5, 10):
+        assert pool.submit(status(userid), tag=2)
+    pool.join()
+    pool.close()
+
+    assert sorted(accepted) == [(u, 1) for u in range(5)] + [(u, 2) for u in range(5, 10)]
+    # stale rounds are for accept to drop: every candidate was still scored and cached
+    assert pool.counts['checked'] == 10
+
+
+def test_scores_are_cached_across_pools(tmp_path):
+    stub = StubBotometer(latency=0.0)
+    for _ in range(2):
+        pool = BotCheckPool(stub.check_account, lambda s, score, tag: None, BotScoreCache(str(tmp_path / 'bots.db')))
+        for userid in range(20):
+            pool.submit(status(userid))
+        pool.join()
+        pool.close()
+    assert stub.calls == 20
@@ -0,0 +1,45 @@
+# coding: utf-8
+import re
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('emoji')
+
+from en_normalization import emoji_characters, normalize_message, normalize_messages
+
+
+EMOJI = set(emoji_characters())
+
+
+def baseline_normalize(m):
+    # the per-character loop of the original run_en_sentistrength.py, without the Python 2 decode/encode
+    linewritelist = re.findall(u'(?:[\ud800-\udbff][\udc00-\udfff])|.', m)
+    linewrite = ''.join('\t' + c + '\t' if c in EMOJI else c for c in linewritelist)
+    return linewrite.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+
+
+MESSAGES = [
+    'hello world',
+    'hello\nworld',
+    'hello\r\nworld',
+    'hello\tworld',
+    'line one\n\nline two\r\n',
+    '\nleading and trailing\n',
+    'tabs\t\tand\r\rreturns',
+    u'café\nau lait',
+    u'so happy\U0001F600\nsee you\r\ntomorrow\t\U0001F44D',
+    u'\U0001F600\U0001F600',
+    '',
+]
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_normalize_message_matches_baseline(message):
+    assert normalize_message(message) == baseline_normalize(message)
+
+
+def test_normalize_messages_matches_baseline():
+    series = pd.Series(MESSAGES + [None])
+    expected = [baseline_normalize(m) for m in MESSAGES] + ['nan']
+    assert normalize_messages(series).tolist() == expected
@@ -0,0 +1,138 @@
+import asyncio
+import csv
+import time
+
+from aiohttp import web
+
+from friend_timelines import MAX_TIMELINE_STATUSES, fetch_friend_timelines, window_start
+from mock_twitter_api import MockTwitterAPI
+from timeline_store import TimelineStore, twitter_time
+
+
+FRIENDS = list(range(1, 31))
+INACCESSIBLE = [4, 9]
+
+
+def serve(api, fetch):
+    '''
+    Run fetch(base_url) against the mock server on a free port.
+    '''
+    async def main():
+        runner = web.AppRunner(api.app())
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        try:
+            return await fetch('http://%s:%d' % runner.addresses[0][:2])
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def fetch(api, output_path, user=42, friends=FRIENDS, **kwargs):
+    return serve(api, lambda url: fetch_friend_timelines(user, friends, str(output_path), 'en', 'key', 'secret',
+                                                         base_url=url, backoff_base=0.01, verbose=False, **kwargs))
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [row for row in csv.reader(f)]
+
+
+def expected_rows(api, user, friends, start=None, count=200):
+    rows = []
+    for friend in friends:
+        if friend in INACCESSIBLE:
+            continue
+        statuses = api.timeline(friend)
+        if start is None:
+            statuses = statuses[:count]
+        else:
+            statuses = [s for s in statuses if twitter_time(s['created_at']) >= start]
+        rows.extend([str(friend), str(user), s['text'], twitter_time(s['created_at'])]
+                    for s in statuses if s['lang'] == 'en')
+    return rows
+
+
+def test_rows_in_friend_order(tmp_path):
+    api = MockTwitterAPI(inaccessible=INACCESSIBLE)
+    counts = fetch(api, tmp_path / 'friends.csv', concurrency=8)
+
+    assert read_rows(tmp_path / 'friends.csv') == expected_rows(api, 42, FRIENDS)
+    assert counts['inaccessible'] == len(INACCESSIBLE)
+    assert counts['failed'] == 0
+    assert counts['requests'] == api.requests == len(FRIENDS)
+
+
+def test_token_bucket_follows_rate_limit_window(tmp_path):
+    # 30 requests at 10 per 1 second window: the bucket waits for two window resets and never gets a 429
+    api = MockTwitterAPI(limit=10, window=1, inaccessible=INACCESSIBLE)
+    started = time.time()
+    counts = fetch(api, tmp_path / 'friends.csv', concurrency=16)
+
+    assert api.rate_limited == 0
+    assert counts['rate_limited'] == 0
+    assert time.time() - started >= 2 * api.window
+    assert read_rows(tmp_path / 'friends.csv') == expected_rows(api, 42, FRIENDS)
+
+
+def test_rate_limited_requests_wait_for_retry_after(tmp_path):
+    # another app used up the window that the rate limit endpoint still reports as full
+    api = MockTwitterAPI(limit=5, window=1, retry_after=2, inaccessible=INACCESSIBLE)
+    full = api._window()
+
+    async def rate_limit_status(request):
+        return web.json_response({'resources': {'statuses': {'/statuses/user_timeline': full}}})
+    api.rate_limit_status = rate_limit_status
+    api.used = api.limit
+
+    started = time.time()
+    counts = fetch(api, tmp_path / 'friends.csv', friends=FRIENDS[:10], concurrency=16)
+
+    # the requests in flight get a 429 and are retried once, after Retry-After, not with short backoffs
+    assert 1 <= api.rate_limited <= api.limit
+    assert counts['rate_limited'] == api.rate_limited
+    assert time.time() - started >= api.retry_after
+    assert counts['failed'] == 0
+    assert read_rows(tmp_path / 'friends.csv') == expected_rows(api, 42, FRIENDS[:10])
+
+
+def test_store_fetches_since_id_deltas(tmp_path):
+    api = MockTwitterAPI(inaccessible=INACCESSIBLE)
+    with TimelineStore(str(tmp_path / 'timelines.db')) as store:
+        fetch(api, tmp_path / 'first.csv', store=store)
+        requests = api.requests
+        counts = fetch(api, tmp_path / 'second.csv', store=store)
+
+    # every friend is asked only for statuses newer than the stored ones, and the rows come from the store
+    assert counts['deltas'] == len(FRIENDS) - len(INACCESSIBLE)
+    assert api.requests - requests == len(FRIENDS)
+    assert read_rows(tmp_path / 'second.csv') == read_rows(tmp_path / 'first.csv')
+    assert read_rows(tmp_path / 'first.csv') == expected_rows(api, 42, FRIENDS)
+
+
+def test_window_paging(tmp_path):
+    # quiet and regular friends have a week of statuses in their first page; active ones need more pages
+    # and reach the end of their 1000 statuses
+    api = MockTwitterAPI(inaccessible=INACCESSIBLE)
+    start = window_start()
+    with TimelineStore(str(tmp_path / 'timelines.db')) as store:
+        counts = fetch(api, tmp_path / 'window.csv', store=store, start=start)
+        assert read_rows(tmp_path / 'window.csv') == expected_rows(api, 42, FRIENDS, start=start)
+
+        accessible = [friend for friend in FRIENDS if friend not in INACCESSIBLE]
+        in_window = [len([s for s in api.timeline(friend) if twitter_time(s['created_at']) >= start])
+                     for friend in accessible]
+        stopped_at_start = len([n for n in in_window if n < api.statuses_per_user])
+        pages = sum(n // 200 + 1 for n in in_window)
+        assert 0 < stopped_at_start < len(accessible)
+        assert counts['requests'] == pages + len(INACCESSIBLE)
+        # pages not requested up to the 3200 statuses of each timeline that stopped at start
+        assert counts['requests_saved'] == sum(int((MAX_TIMELINE_STATUSES - (n // 200 + 1) * 200) / 200)
+                                               for n in in_window if n < api.statuses_per_user)
+
+        # a since_id delta has nothing to page back through: nothing is saved by stopping at start
+        counts = fetch(api, tmp_path / 'delta.csv', store=store, start=start)
+    assert counts['requests'] == len(FRIENDS)
+    assert counts['requests_saved'] == 0
+    assert counts['bytes_saved'] == 0
+    assert read_rows(tmp_path / 'delta.csv') == read_rows(tmp_path / 'window.csv')
@@ -0,0 +1,34 @@
+import pytest
+
+from lexicon_scorer import LexiconScorer
+from process_sentistrength_results import read_sentistrength_output
+from run_en_sentistrength import run_en_sentistrength
+
+
+@pytest.fixture
+def dictionary(tmp_path):
+    folder = tmp_path / 'dictionary'
+    folder.mkdir()
+    (folder / 'EmotionLookupTable.txt').write_text('love\t3\ngood\t2\nbad\t-3\n')
+    (folder / 'NegatingWordList.txt').write_text('not\n')
+    return str(folder) + '/'
+
+
+def test_lexicon_backend_runs_without_sentistrength(tmp_path, dictionary, capsys):
+    input_path = tmp_path / 'statuses.csv'
+    input_path.write_text('message\nI love this\nthis is not good\nthat was bad\n')
+    output_folder = str(tmp_path) + '/'
+    cache_path = str(tmp_path / 'scores.db')
+
+    run_en_sentistrength(str(input_path), output_folder, str(tmp_path / 'missing' / 'SentiStrength.jar'), dictionary,
+                         pool=LexiconScorer(dictionary, 'EN'), cache_path=cache_path)
+
+    scores = read_sentistrength_output(output_folder + 'output_messages_out.txt')
+    assert list(scores['pos']) == [3, 1, 1]
+    assert list(scores['neg']) == [-1, -1, -3]
+
+    # the cache version depends on the dictionary files only, not on the (unused) program path
+    capsys.readouterr()
+    run_en_sentistrength(str(input_path), output_folder, str(tmp_path / 'other.jar'), dictionary,
+                         pool=LexiconScorer(dictionary, 'EN'), cache_path=cache_path)
+    assert '100.0% from the score cache' in capsys.readouterr().out
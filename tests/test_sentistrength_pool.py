@@ -0,0 +1,57 @@
+import os
+import stat
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from sentistrength_pool import SentiStrengthPool
+
+
+# stands in for "java -jar SentiStrength.jar ... stdin": one "pos neg" answer per line, a malformed answer for
+# "GARBAGE" (the answers of the rest of the batch still follow), and an exit for "CRASH"
+FAKE_JAVA = textwrap.dedent('''\
+    #!%s
+    import sys
+    for line in sys.stdin:
+        line = line.rstrip('\\n')
+        if line == 'CRASH':
+            sys.exit(3)
+        if line == 'GARBAGE':
+            print('not a score')
+        else:
+            print('%%d %%d' %% (1 + len(line) %% 5, -1 - len(line) %% 3))
+        sys.stdout.flush()
+''') % sys.executable
+
+
+def expected(messages):
+    return (np.array([1 + len(m) % 5 for m in messages], dtype=np.int8),
+            np.array([-1 - len(m) % 3 for m in messages], dtype=np.int8))
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    java = tmp_path / 'java'
+    java.write_text(FAKE_JAVA)
+    java.chmod(java.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    pool = SentiStrengthPool('SentiStrength.jar', str(tmp_path), workers=1, batch_size=10)
+    yield pool
+    pool.close()
+
+
+MESSAGES = ['message %s' % ('x' * n) for n in range(25)]
+
+
+@pytest.mark.parametrize('failure', ['GARBAGE', 'CRASH'])
+def test_failure_mid_batch_does_not_misalign_next_batches(pool, failure):
+    np.testing.assert_array_equal(pool.score(MESSAGES), expected(MESSAGES))
+
+    with pytest.raises((ValueError, RuntimeError)):
+        pool.score(MESSAGES[:3] + [failure] + MESSAGES[3:8])
+
+    # the batches after the failure get their own answers
+    for _ in range(3):
+        np.testing.assert_array_equal(pool.score(MESSAGES), expected(MESSAGES))
@@ -0,0 +1,93 @@
+import os
+import stat
+import sys
+import textwrap
+import time
+
+import pytest
+
+from sentistrength_runner import EN_OPTIONS, output_path_of, run_sentistrength
+
+
+# stands in for "java -jar SentiStrength.jar sentidata [folder] input [file] ...": writes [file]_out.txt with a
+# header and one "pos neg text" line per input line, exits on a "FAIL" line and never finishes on a "HANG" line
+FAKE_JAVA = textwrap.dedent('''\
+    #!%s
+    import os
+    import sys
+    import time
+    path = sys.argv[sys.argv.index('input') + 1]
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if 'FAIL' in lines:
+        print('shard failed')
+        sys.exit(2)
+    if 'HANG' in lines:
+        time.sleep(600)
+    with open(os.path.splitext(path)[0] + '_out.txt', 'w', encoding='utf-8') as f:
+        f.write('Positive\\tNegative\\tText\\n')
+        for line in lines:
+            f.write('%%d\\t%%d\\t%%s\\n' %% (1 + len(line) %% 5, -1 - len(line) %% 3, line))
+''') % sys.executable
+
+
+@pytest.fixture
+def java(tmp_path, monkeypatch):
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    java = bin_path / 'java'
+    java.write_text(FAKE_JAVA)
+    java.chmod(java.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(bin_path) + os.pathsep + os.environ['PATH'])
+
+
+def run(path, shards):
+    return run_sentistrength(str(path), 'SentiStrength.jar', str(path.parent), EN_OPTIONS, shards=shards,
+                             verbose=False)
+
+
+def texts(output):
+    with open(output, encoding='utf-8') as f:
+        assert f.readline() == 'Positive\tNegative\tText\n'
+        return [line.rstrip('\n').split('\t')[2] for line in f]
+
+
+@pytest.mark.parametrize('shards', [1, 3, 8])
+def test_sharded_output_is_in_input_order(tmp_path, java, shards):
+    lines = ['message %d %s' % (n, 'x' * (n % 7)) for n in range(50)]
+    path = tmp_path / 'output_messages.txt'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    output = run(path, shards)
+
+    assert output == output_path_of(str(path))
+    assert texts(output) == lines
+    # shards, their outputs and the logs are removed
+    assert sorted(os.listdir(tmp_path)) == ['bin', 'output_messages.txt', 'output_messages_out.txt']
+
+
+def test_unterminated_last_line(tmp_path, java):
+    lines = ['message %d' % n for n in range(10)]
+    path = tmp_path / 'output_messages.txt'
+    path.write_text('\n'.join(lines), encoding='utf-8')
+
+    assert texts(run(path, 3)) == lines
+
+
+def test_empty_file(tmp_path, java):
+    path = tmp_path / 'output_messages.txt'
+    path.write_bytes(b'')
+
+    assert texts(run(path, 3)) == []
+
+
+def test_failing_shard_is_reported(tmp_path, java):
+    # the first shard hangs, the last one fails
+    lines = ['HANG'] + ['message %d' % n for n in range(30)] + ['FAIL']
+    path = tmp_path / 'output_messages.txt'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    start = time.time()
+    with pytest.raises(RuntimeError, match='(?s)status 2.*shard failed'):
+        run(path, 4)
+    assert time.time() - start < 60